@@ -0,0 +1,169 @@
+"""Benchmark parsing, phrase counting and chart rendering on synthetic chats.
+
+Usage::
+
+    python -m benchmarks.run                      # 10k, 1M and 10M messages
+    python -m benchmarks.run --sizes 10000 100000 --compare
+
+Every run is saved as JSON under benchmarks/results/, and --compare prints
+the change against the previous saved run.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.synth import generate_chat
+from src.analyzer import ChatAnalyzer
+from src.parser import WhatsAppParser
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+DEFAULT_SIZES = [10_000, 1_000_000, 10_000_000]
+
+ONE_PHRASE = ['lol']
+MANY_PHRASES = ['lol', 'hello', 'good morning', 'thank you', 'see you soon',
+                'dinner', 'straße', '😂', 'where are you', 'sounds great']
+
+
+def measure(func, memory: bool):
+    """Run ``func`` and return (result, seconds, peak traced bytes or None).
+
+    Timing runs without tracemalloc, which slows allocation-heavy code
+    down considerably; peak memory is measured in a second run.
+    """
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+
+    peak = None
+    if memory:
+        result = None
+        tracemalloc.start()
+        try:
+            result = func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, seconds, peak
+
+
+def record(results, name, size, seconds, peak, items, unit):
+    entry = {
+        'benchmark': name,
+        'messages': size,
+        'seconds': round(seconds, 4),
+        'throughput': round(items / seconds, 1) if seconds else None,
+        'unit': unit,
+        'peak_bytes': peak,
+    }
+    results.append(entry)
+
+    peak_text = f"{peak / 1e6:9.1f} MB" if peak is not None else "        -"
+    print(f"{name:<14} {size:>11,} {seconds:9.3f}s {entry['throughput']:>14,.0f} {unit:<12} {peak_text}")
+
+
+def fold(store):
+    # The folded copy is cached on the store, so drop it to time building it
+    store._folded = None
+    return store.folded()
+
+
+def count(store, phrases):
+    """Count with a fresh analyzer and folded text, as a first query would."""
+    store._folded = None
+    return ChatAnalyzer(store).count_phrases(phrases)
+
+
+def run_size(size: int, fmt: int, workdir: str, memory: bool, charts: bool):
+    results = []
+    path = os.path.join(workdir, f"chat_{size}_{fmt}.txt")
+    lines = generate_chat(path, size, fmt, seed=size)
+
+    store, seconds, peak = measure(lambda: WhatsAppParser(path).parse_store(), memory)
+    record(results, 'parse', size, seconds, peak, lines, 'lines/s')
+
+    _, seconds, peak = measure(lambda: fold(store), memory)
+    record(results, 'fold', size, seconds, peak, size, 'messages/s')
+
+    for name, phrases in (('count_1', ONE_PHRASE), (f'count_{len(MANY_PHRASES)}', MANY_PHRASES)):
+        # Every run folds the text again and starts with an empty result
+        # cache, so the count benchmarks include the same work
+        analyses, seconds, peak = measure(lambda: count(store, phrases), memory)
+        record(results, name, size, seconds, peak, size, 'messages/s')
+
+    if charts:
+        from src.visualizer import render_charts
+        out_dir = os.path.join(workdir, 'charts')
+        _, seconds, peak = measure(lambda: render_charts(analyses, out_dir, workers=1), memory)
+        record(results, 'render', size, seconds, peak, len(analyses), 'phrases/s')
+
+    os.remove(path)
+    return results
+
+
+def previous_run():
+    runs = sorted(glob.glob(os.path.join(RESULTS_DIR, '*.json')))
+    if not runs:
+        return None
+    with open(runs[-1], 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def compare(current, previous):
+    print(f"\nCompared with run of {previous['started']}:")
+    before = {(r['benchmark'], r['messages']): r for r in previous['results']}
+    for result in current:
+        old = before.get((result['benchmark'], result['messages']))
+        if not old or not old['seconds']:
+            continue
+        change = (result['seconds'] - old['seconds']) / old['seconds'] * 100
+        print(f"  {result['benchmark']:<14} {result['messages']:>11,}  "
+              f"{old['seconds']:9.3f}s -> {result['seconds']:9.3f}s  ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chat analyzer")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="numbers of messages to benchmark")
+    parser.add_argument('--format', type=int, choices=range(4), default=0,
+                        help="export format of the generated chats")
+    parser.add_argument('--no-memory', action='store_true', help="skip the peak memory runs")
+    parser.add_argument('--no-charts', action='store_true', help="skip chart rendering")
+    parser.add_argument('--compare', action='store_true', help="compare with the previous saved run")
+    args = parser.parse_args()
+
+    previous = previous_run() if args.compare else None
+    started = datetime.now()
+
+    print(f"{'benchmark':<14} {'messages':>11} {'time':>10} {'throughput':>14} {'':<12} {'peak':>12}")
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            results += run_size(size, args.format, workdir, not args.no_memory, not args.no_charts)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = os.path.join(RESULTS_DIR, f"{started:%Y%m%d-%H%M%S}.json")
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump({
+            'started': started.isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'format': args.format,
+            'results': results,
+        }, file, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if previous:
+        compare(results, previous)
+
+
+if __name__ == '__main__':
+    main()
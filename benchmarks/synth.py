@@ -0,0 +1,85 @@
+"""Generate deterministic synthetic WhatsApp chat exports for benchmarking."""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+
+SENDERS = ['Alice', 'Bob', 'Charlie', 'Dana', 'Émile', 'Frieda Müller', 'Günther', 'Hana 花子']
+
+WORDS = (
+    'hello lol good morning thank you ok yes no haha see you soon maybe tonight '
+    'dinner where are you 😂 👍 LOL Straße café omw brb sure sounds great what why'
+).split()
+
+SYSTEM_MESSAGES = [
+    'Messages and calls are end-to-end encrypted.',
+    'Dana changed their phone number.',
+    'Alice added you',
+    'Bob created group "Weekend"',
+]
+
+
+def format_header(fmt: int, when: datetime, sender: str, text: str) -> str:
+    """Format one message line in one of the four supported export formats."""
+    if fmt == 0:
+        # [DD/MM/YYYY, HH:MM:SS] Name: Message
+        return f"[{when:%d/%m/%Y}, {when:%H:%M:%S}] {sender}: {text}"
+    if fmt == 1:
+        # DD/MM/YYYY, H:MM am/pm - Name: Message
+        hour = when.hour % 12 or 12
+        meridiem = 'am' if when.hour < 12 else 'pm'
+        return f"{when.day}/{when.month}/{when:%Y}, {hour}:{when:%M} {meridiem} - {sender}: {text}"
+    if fmt == 2:
+        # DD/MM/YYYY, HH:MM - Name: Message
+        return f"{when:%d/%m/%Y}, {when:%H:%M} - {sender}: {text}"
+    # [DD.MM.YY, HH:MM:SS] Name: Message (German format)
+    return f"[{when:%d.%m.%y}, {when:%H:%M:%S}] {sender}: {text}"
+
+
+def generate_chat(path: str, messages: int, fmt: int = 0, seed: int = 0,
+                  multiline_rate: float = 0.05, system_rate: float = 0.01) -> int:
+    """Write a chat with ``messages`` messages to ``path`` and return its line count.
+
+    The same arguments always produce the same file. About ``multiline_rate``
+    of the messages span several lines and ``system_rate`` system messages
+    are mixed in.
+    """
+    rng = random.Random(seed)
+    when = datetime(2015, 1, 1, 8, 0, 0)
+    lines = 0
+
+    with open(path, 'w', encoding='utf-8') as file:
+        for _ in range(messages):
+            when += timedelta(seconds=rng.randint(0, 900))
+
+            if rng.random() < system_rate:
+                file.write(format_header(fmt, when, 'Group', rng.choice(SYSTEM_MESSAGES)) + "\n")
+                lines += 1
+
+            text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+            file.write(format_header(fmt, when, rng.choice(SENDERS), text) + "\n")
+            lines += 1
+
+            if rng.random() < multiline_rate:
+                for _ in range(rng.randint(1, 3)):
+                    file.write(' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 8))) + "\n")
+                    lines += 1
+
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic WhatsApp chat export")
+    parser.add_argument('path')
+    parser.add_argument('messages', type=int)
+    parser.add_argument('--format', type=int, choices=range(4), default=0,
+                        help="0: [DD/MM/YYYY, HH:MM:SS], 1: am/pm, 2: DD/MM/YYYY, HH:MM, 3: German")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    lines = generate_chat(args.path, args.messages, args.format, args.seed)
+    print(f"Wrote {args.messages} messages ({lines} lines) to {args.path}")
+
+
+if __name__ == '__main__':
+    main()
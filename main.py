@@ -3,10 +3,19 @@ import os
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext
 from tkinter import ttk
+import queue
 import threading
-from src.parser import WhatsAppParser
-from src.analyzer import ChatAnalyzer
-from src.visualizer import ChatVisualizer
+from src.visualizer import DEFAULT_VIEWS, VIEWS, render_charts
+from src.ingest import Cancelled, load_analyzer
+from src.instrumentation import Tracer, profiled, set_tracer, traced_memory
+
+
+# Written after every parse and analysis; open in chrome://tracing or Perfetto
+TRACE_PATH = os.path.join('output', 'trace.json')
+PROFILE_PATH = os.path.join('output', 'profile.prof')
+
+# How often the main loop picks up events from the worker thread, in milliseconds
+POLL_MS = 100
 
 
 class WhatsAppAnalyzerGUI:
@@ -19,6 +28,14 @@ class WhatsAppAnalyzerGUI:
         self.chat_file = None
         self.chat_files = []
         self.messages = None
+        # One analyzer per loaded corpus, so its result cache survives between runs
+        self.analyzer = None
+        
+        # Parsing and analysis run in a worker thread that reports back
+        # through this queue; only the main thread touches Tk
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.busy = False
         
         self.create_widgets()
     
@@ -78,6 +95,26 @@ class WhatsAppAnalyzerGUI:
         )
         case_check.pack(anchor="w")
         
+        # Weekly, hour-of-day and per-sender charts come from each phrase's cube
+        self.more_charts_var = tk.BooleanVar()
+        more_charts_check = tk.Checkbutton(
+            phrase_frame,
+            text="More charts (weekly, hour of day, senders)",
+            variable=self.more_charts_var,
+            font=("Arial", 9)
+        )
+        more_charts_check.pack(anchor="w")
+        
+        # cProfile and allocation tracing are opt-in, they slow everything down noticeably
+        self.profile_var = tk.BooleanVar()
+        profile_check = tk.Checkbutton(
+            phrase_frame,
+            text=f"Profile and trace memory (writes {PROFILE_PATH})",
+            variable=self.profile_var,
+            font=("Arial", 9)
+        )
+        profile_check.pack(anchor="w")
+        
         # Analyze button
         analyze_btn = tk.Button(
             self.root,
@@ -92,20 +129,31 @@ class WhatsAppAnalyzerGUI:
         )
         analyze_btn.pack(pady=15)
         
-        # Progress bar
+        # Progress bar and cancel button, only shown while a task runs
+        self.progress_frame = tk.Frame(self.root)
         self.progress = ttk.Progressbar(
-            self.root,
-            mode='indeterminate',
+            self.progress_frame,
+            mode='determinate',
             length=300
         )
+        self.progress.pack(side="left")
+        
+        self.cancel_btn = tk.Button(
+            self.progress_frame,
+            text="Cancel",
+            command=self.cancel,
+            font=("Arial", 9),
+            cursor="hand2"
+        )
+        self.cancel_btn.pack(side="left", padx=10)
         
         # Results text area
-        results_label = tk.Label(
+        self.results_label = tk.Label(
             self.root,
             text="Results:",
             font=("Arial", 10, "bold")
         )
-        results_label.pack(anchor="w", padx=20)
+        self.results_label.pack(anchor="w", padx=20)
         
         self.results_text = scrolledtext.ScrolledText(
             self.root,
@@ -127,9 +175,14 @@ class WhatsAppAnalyzerGUI:
         self.status_label.pack(side="bottom", fill="x", padx=5, pady=5)
     
     def select_files(self):
+        if self.busy:
+            messagebox.showwarning("Warning", "Please wait for the current task to finish or cancel it.")
+            return
+        
         file_paths = filedialog.askopenfilenames(
             title="Select WhatsApp Chat Export(s)",
-            filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
+            filetypes=[("Chat exports", "*.txt *.zip"), ("Text files", "*.txt"),
+                       ("Zip exports", "*.zip"), ("All files", "*.*")]
         )
         
         if file_paths:
@@ -148,49 +201,50 @@ class WhatsAppAnalyzerGUI:
             self.parse_files()
     
     def parse_files(self):
-        try:
-            self.update_status("Parsing chat files...")
-            all_messages = []
-            seen_messages = set()  # To detect duplicates
-            
-            for i, file_path in enumerate(self.chat_files, 1):
-                self.update_status(f"Parsing file {i}/{len(self.chat_files)}...")
-                
-                parser = WhatsAppParser(file_path)
-                messages = parser.parse()
-                
-                # Add messages while checking for duplicates
-                for msg in messages:
-                    # Create unique identifier: datetime + sender + message
-                    msg_id = (msg['datetime'], msg['sender'], msg['message'])
-                    
-                    if msg_id not in seen_messages:
-                        seen_messages.add(msg_id)
-                        all_messages.append(msg)
-            
-            self.messages = sorted(all_messages, key=lambda x: x['datetime'])
+        # Reloading a grown export extends the previous analyzer instead of recounting
+        previous = self.analyzer
+        self.messages = None
+        self.analyzer = None
+        self.update_status(f"Parsing {len(self.chat_files)} chat file(s)...")
+        self.start_task(self.load_messages, (list(self.chat_files), previous, self.profile_path()),
+                        self.show_parse_results, "Failed to parse files", "Error parsing files",
+                        determinate=True)
+    
+    def load_messages(self, chat_files, previous, profile_path):
+        """Parse the files (runs in the worker thread)."""
+        tracer = set_tracer(Tracer())
+        with traced_memory(profile_path is not None), profiled(profile_path):
+            # Files are parsed once each, in parallel; duplicates are counted while merging
+            analyzer, duplicate_count = load_analyzer(chat_files, previous, progress=self.report_progress)
+        return analyzer, duplicate_count, tracer
+    
+    def show_parse_results(self, result):
+        analyzer, duplicate_count, tracer = result
+        self.messages = analyzer.messages
+        self.analyzer = analyzer if self.messages else None
+        
+        if self.messages:
+            status_msg = f"✓ Parsed {len(self.messages)} unique messages"
+            if duplicate_count > 0:
+                status_msg += f" ({duplicate_count} duplicates removed)"
             
-            if self.messages:
-                duplicate_count = sum(len(WhatsAppParser(f).parse()) for f in self.chat_files) - len(self.messages)
-                status_msg = f"✓ Parsed {len(self.messages)} unique messages"
-                if duplicate_count > 0:
-                    status_msg += f" ({duplicate_count} duplicates removed)"
-                
-                self.update_status(status_msg)
-                self.results_text.delete(1.0, tk.END)
-                result_text = f"Successfully parsed {len(self.messages)} unique messages from {len(self.chat_files)} file(s)."
-                if duplicate_count > 0:
-                    result_text += f"\n{duplicate_count} duplicate messages were removed."
-                result_text += "\n\nEnter phrase(s) and click Analyze."
-                self.results_text.insert(1.0, result_text)
-            else:
-                messagebox.showwarning("Warning", "No messages found. Check file format.")
-                self.update_status("No messages found")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to parse files:\n{str(e)}")
-            self.update_status("Error parsing files")
+            self.update_status(status_msg)
+            self.results_text.delete(1.0, tk.END)
+            result_text = f"Successfully parsed {len(self.messages)} unique messages from {len(self.chat_files)} file(s)."
+            if duplicate_count > 0:
+                result_text += f"\n{duplicate_count} duplicate messages were removed."
+            result_text += "\n\nEnter phrase(s) and click Analyze."
+            result_text += "\n\n" + self.trace_report(tracer, self.profile_var.get())
+            self.results_text.insert(1.0, result_text)
+        else:
+            messagebox.showwarning("Warning", "No messages found. Check file format.")
+            self.update_status("No messages found")
     
     def analyze(self):
+        if self.busy:
+            messagebox.showwarning("Warning", "Please wait for the current task to finish or cancel it.")
+            return
+        
         if not self.chat_files:
             messagebox.showwarning("Warning", "Please select chat file(s) first.")
             return
@@ -204,87 +258,168 @@ class WhatsAppAnalyzerGUI:
             messagebox.showwarning("Warning", "Please enter at least one phrase to search for.")
             return
         
-        # Run analysis in separate thread to prevent UI freezing
-        thread = threading.Thread(target=self.run_analysis, args=(phrase_input,))
-        thread.daemon = True
-        thread.start()
+        # Split phrases by comma
+        phrases = [p.strip() for p in phrase_input.split(',') if p.strip()]
+        
+        if not phrases:
+            messagebox.showwarning("Warning", "No valid phrases found.")
+            return
+        
+        # Tk variables are read here, the worker thread must not touch Tk
+        self.update_status("Analyzing...")
+        self.results_text.delete(1.0, tk.END)
+        views = VIEWS if self.more_charts_var.get() else DEFAULT_VIEWS
+        self.start_task(self.run_analysis, (phrases, self.case_sensitive_var.get(), views, self.profile_path()),
+                        self.show_analysis_results, "Analysis failed", "Error during analysis")
     
-    def run_analysis(self, phrase_input):
-        try:
-            self.progress.pack(pady=5)
-            self.progress.start()
-            self.update_status("Analyzing...")
-            
-            # Split phrases by comma
-            phrases = [p.strip() for p in phrase_input.split(',') if p.strip()]
-            
-            if not phrases:
-                self.root.after(0, messagebox.showwarning, "Warning", "No valid phrases found.")
-                return
-            
-            case_sensitive = self.case_sensitive_var.get()
-            analyzer = ChatAnalyzer(self.messages)
-            
-            # Clear results
-            self.root.after(0, self.results_text.delete, 1.0, tk.END)
-            
-            all_results = ""
-            all_analyses = []
-            
-            # Analyze each phrase
-            for i, phrase in enumerate(phrases, 1):
-                self.update_status(f"Analyzing phrase {i}/{len(phrases)}: {phrase}")
-                
-                analysis = analyzer.count_phrase(phrase, case_sensitive)
-                all_analyses.append(analysis)
-                summary = analyzer.get_summary(phrase, case_sensitive)
-                
-                all_results += summary + "\n"
-                
-                # Create visualizations
-                visualizer = ChatVisualizer(analysis)
-                
-                os.makedirs('output', exist_ok=True)
-                
-                safe_phrase = "".join(c if c.isalnum() else "_" for c in phrase)
-                monthly_chart = f"output/{safe_phrase}_monthly.png"
-                timeline_chart = f"output/{safe_phrase}_timeline.png"
-                
-                visualizer.plot_monthly_usage(monthly_chart)
-                visualizer.plot_timeline(timeline_chart)
-                
-                all_results += f"Visualizations saved:\n• {monthly_chart}\n• {timeline_chart}\n"
-                all_results += "\n" + "="*60 + "\n\n"
-            
-            # Create master graph if multiple phrases
-            if len(all_analyses) > 1:
-                self.update_status("Creating master graph...")
-                try:
-                    master_chart = "output/master_combined_graph.png"
-                    ChatVisualizer.plot_master_graph(all_analyses, master_chart)
-                    all_results += f"\n{'='*60}\n"
-                    all_results += f"MASTER GRAPH (ALL PHRASES COMBINED):\n• {master_chart}\n"
-                    all_results += f"{'='*60}\n"
-                except Exception as e:
-                    print(f"Error creating master graph: {e}")
-                    all_results += f"\nError creating master graph: {str(e)}\n"
-            
-            # Update results
-            self.root.after(0, self.results_text.insert, 1.0, all_results)
+    def run_analysis(self, phrases, case_sensitive, views, profile_path):
+        """Count the phrases and render the charts (runs in the worker thread)."""
+        analyzer = self.analyzer
+        tracer = set_tracer(Tracer())
+        
+        all_results = ""
+        
+        with traced_memory(profile_path is not None), profiled(profile_path):
+            # Count all phrases in a single pass over the messages
+            all_analyses = analyzer.count_phrases(phrases, case_sensitive)
+            self.check_cancelled()
             
-            success_msg = f"Analysis complete for {len(phrases)} phrase(s)!"
-            if len(all_analyses) > 1:
-                success_msg += "\nMaster graph created combining all phrases."
+            # Render every chart concurrently
+            self.post('status', f"Rendering charts for {len(phrases)} phrase(s)...")
+            rendered = render_charts(all_analyses, 'output', views=views)
+        
+        for phrase, analysis, charts in zip(phrases, all_analyses, rendered['charts']):
+            summary = analyzer.get_summary(phrase, case_sensitive, analysis)
             
-            self.root.after(0, self.update_status, f"✓ {success_msg}")
-            self.root.after(0, messagebox.showinfo, "Success", success_msg + "\nCheck the output folder for graphs.")
+            all_results += summary + "\n"
+            all_results += "Visualizations saved:\n"
+            all_results += "".join(f"• {path}\n" for view, path in charts.items() if view != 'phrase')
+            all_results += "\n" + "="*60 + "\n\n"
+        
+        # Master graph if multiple phrases
+        if rendered['master']:
+            all_results += f"\n{'='*60}\n"
+            all_results += f"MASTER GRAPH (ALL PHRASES COMBINED):\n• {rendered['master']}\n"
+            all_results += f"{'='*60}\n"
+        elif rendered['master_error']:
+            all_results += f"\nError creating master graph: {rendered['master_error']}\n"
+        
+        all_results += f"\nCharts rendered in {rendered['seconds']:.2f}s\n"
+        all_results += "\n" + self.trace_report(tracer, profile_path is not None)
+        
+        success_msg = f"Analysis complete for {len(phrases)} phrase(s)!"
+        if len(all_analyses) > 1:
+            success_msg += "\nMaster graph created combining all phrases."
+        return all_results, success_msg
+    
+    def show_analysis_results(self, result):
+        all_results, success_msg = result
+        self.results_text.insert(1.0, all_results)
+        self.update_status(f"✓ {success_msg}")
+        messagebox.showinfo("Success", success_msg + "\nCheck the output folder for graphs.")
+    
+    def start_task(self, work, args, on_done, error_message, error_status, determinate=False):
+        """Run ``work(*args)`` in a worker thread and pass its result to ``on_done``.
+        
+        The worker never touches Tk: it posts events to a queue that the
+        main loop drains every POLL_MS milliseconds.
+        """
+        self.busy = True
+        self.cancel_event.clear()
+        self.show_progress(determinate)
+        
+        def run():
+            try:
+                self.post('done', on_done, work(*args))
+            except Cancelled:
+                self.post('cancelled')
+            except Exception as e:
+                self.post('error', error_message, error_status, e)
+        
+        threading.Thread(target=run, daemon=True).start()
+        self.root.after(POLL_MS, self.drain_events)
+    
+    def post(self, kind, *args):
+        """Send an event from the worker thread to the main loop."""
+        self.events.put((kind,) + args)
+    
+    def report_progress(self, done, total):
+        """Progress callback for load_files; also where a parse gets cancelled."""
+        self.check_cancelled()
+        self.post('progress', done, total)
+        if done >= total:
+            self.post('status', "Removing duplicates...")
+    
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise Cancelled()
+    
+    def drain_events(self):
+        """Apply the worker's events on the main thread."""
+        while True:
+            try:
+                kind, *args = self.events.get_nowait()
+            except queue.Empty:
+                break
             
-        except Exception as e:
-            self.root.after(0, messagebox.showerror, "Error", f"Analysis failed:\n{str(e)}")
-            self.root.after(0, self.update_status, "Error during analysis")
-        finally:
-            self.root.after(0, self.progress.stop)
-            self.root.after(0, self.progress.pack_forget)
+            if kind == 'progress':
+                done, total = args
+                self.progress.config(maximum=max(total, 1), value=done)
+            elif kind == 'status':
+                self.update_status(args[0])
+            else:
+                self.finish_task()
+                if kind == 'done':
+                    on_done, result = args
+                    on_done(result)
+                elif kind == 'cancelled':
+                    self.update_status("Cancelled")
+                else:
+                    error_message, error_status, e = args
+                    messagebox.showerror("Error", f"{error_message}:\n{str(e)}")
+                    self.update_status(error_status)
+                return
+        
+        self.root.after(POLL_MS, self.drain_events)
+    
+    def cancel(self):
+        if self.busy:
+            self.cancel_event.set()
+            self.cancel_btn.config(state="disabled")
+            self.update_status("Cancelling...")
+    
+    def show_progress(self, determinate):
+        if determinate:
+            self.progress.config(mode='determinate', value=0)
+        else:
+            self.progress.config(mode='indeterminate')
+            self.progress.start()
+        self.cancel_btn.config(state="normal")
+        self.progress_frame.pack(pady=5, before=self.results_label)
+    
+    def finish_task(self):
+        self.busy = False
+        self.progress.stop()
+        self.progress_frame.pack_forget()
+    
+    def profile_path(self):
+        """Where to dump cProfile stats, or None when profiling is off."""
+        if not self.profile_var.get():
+            return None
+        os.makedirs(os.path.dirname(PROFILE_PATH), exist_ok=True)
+        return PROFILE_PATH
+    
+    def trace_report(self, tracer, profiled):
+        """Write the trace file and return the per-stage table for the results pane."""
+        report = "Stage timings:\n" + tracer.summary()
+        try:
+            tracer.write(TRACE_PATH)
+            report += f"\n\nTrace saved to {TRACE_PATH}"
+        except OSError as e:
+            report += f"\n\nCould not save trace: {e}"
+        if profiled:
+            report += f"\nProfile saved to {PROFILE_PATH}"
+        return report + "\n"
     
     def update_status(self, message):
         self.status_label.config(text=message)
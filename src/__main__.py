@@ -0,0 +1,8 @@
+"""Allow running the command-line interface with ``python -m src``."""
+import sys
+
+from src.cli import main
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,61 +1,425 @@
 """Analyze parsed WhatsApp messages."""
-from collections import defaultdict, Counter
-from datetime import datetime
-from typing import List, Dict
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from src.cube import SECONDS_PER_HOUR, PhraseCube
+from src.index import TrigramIndex
+from src.instrumentation import span
+from src.store import SECONDS_PER_DAY, MessageStore, to_epoch
+
+
+# Number of phrase results kept by each ChatAnalyzer
+RESULT_CACHE_SIZE = 256
+# Memory the kept results may take up in total, in bytes
+RESULT_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def _check_phrases(phrases: List[str]):
+    # An empty phrase would match between every two characters
+    if any(not phrase for phrase in phrases):
+        raise ValueError("Phrases must not be empty")
+
+
+class Occurrences:
+    """Where a phrase was found, as parallel arrays in time order.
+
+    - ``index``: int64 index of each message containing the phrase
+    - ``count``: int64 number of hits in that message
+    - ``timestamp``: int64 epoch seconds of that message
+    """
+    __slots__ = ('index', 'count', 'timestamp')
+
+    def __init__(self, index: np.ndarray, count: np.ndarray, timestamp: np.ndarray):
+        self.index = index
+        self.count = count
+        self.timestamp = timestamp
+
+    @classmethod
+    def concat(cls, parts: List['Occurrences']) -> 'Occurrences':
+        return cls(
+            np.concatenate([part.index for part in parts]),
+            np.concatenate([part.count for part in parts]),
+            np.concatenate([part.timestamp for part in parts]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Occurrences):
+            return NotImplemented
+        return all(np.array_equal(getattr(self, name), getattr(other, name)) for name in self.__slots__)
+
+    @property
+    def nbytes(self) -> int:
+        return self.index.nbytes + self.count.nbytes + self.timestamp.nbytes
+
+    def take(self, mask: np.ndarray) -> 'Occurrences':
+        return Occurrences(self.index[mask], self.count[mask], self.timestamp[mask])
+
+    def daily_counts(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the days with hits (datetime64[D]) and the number of hits on each."""
+        days = self.timestamp // SECONDS_PER_DAY
+        if not len(days):
+            return np.zeros(0, dtype='datetime64[D]'), np.zeros(0, dtype=np.int64)
+
+        # Input is in time order, so each day is one contiguous run
+        starts = np.flatnonzero(np.concatenate(([True], days[1:] != days[:-1])))
+        return days[starts].astype('datetime64[D]'), np.add.reduceat(self.count, starts)
+
+
+class PhraseCounter:
+    """Count phrases in a stream of messages without keeping the messages.
+
+    Feed messages in time order with add(), then call results(). Only
+    totals per (hour, sender) are kept, so memory grows with the calendar
+    span of the chat rather than its size. Totals, monthly and daily counts
+    and the cube are the same as ChatAnalyzer.count_phrases() gives; the
+    occurrences hold one entry per day (at midnight, with ``index`` -1)
+    instead of one per message.
+    """
+
+    def __init__(self, phrases: List[str], case_sensitive: bool = False):
+        _check_phrases(phrases)
+        self.phrases = list(phrases)
+        self.case_sensitive = case_sensitive
+        self.unique = list(dict.fromkeys(phrases))
+        self.needles = [p if case_sensitive else p.casefold() for p in self.unique]
+        # Hits per (hour since the epoch, sender code) for each distinct phrase
+        self.hourly = [{} for _ in self.unique]
+        self.senders = []
+        self.sender_index = {}
+
+    def add(self, msg: Dict):
+        text = msg['message'] if self.case_sensitive else msg['message'].casefold()
+        key = None
+        for needle, hourly in zip(self.needles, self.hourly):
+            count = text.count(needle)
+            if count:
+                if key is None:
+                    sender = msg['sender']
+                    if sender not in self.sender_index:
+                        self.sender_index[sender] = len(self.senders)
+                        self.senders.append(sender)
+                    key = (to_epoch(msg['datetime']) // SECONDS_PER_HOUR, self.sender_index[sender])
+                hourly[key] = hourly.get(key, 0) + count
+
+    def results(self) -> List[Dict]:
+        """Return one result per phrase, in the format of ChatAnalyzer.count_phrase."""
+        by_phrase = {}
+        for phrase, hourly in zip(self.unique, self.hourly):
+            keys = np.array(list(hourly), dtype=np.int64).reshape(-1, 2)
+            hits = np.array(list(hourly.values()), dtype=np.int64)
+            cube = PhraseCube(keys[:, 0] * SECONDS_PER_HOUR, keys[:, 1].astype(np.int32), hits, self.senders)
+
+            # One occurrence per day with hits
+            days, counts = cube.by_day()
+            days, counts = days[counts > 0], counts[counts > 0]
+            timestamps = days.astype(np.int64) * SECONDS_PER_DAY
+            by_phrase[phrase] = {
+                'phrase': phrase,
+                'total_count': int(counts.sum()),
+                'monthly_counts': ChatAnalyzer._monthly_counts(timestamps, counts),
+                'occurrences': Occurrences(np.full(len(days), -1, dtype=np.int64), counts, timestamps),
+                'cube': cube
+            }
+        return [by_phrase[phrase] for phrase in self.phrases]
 
 
 class ChatAnalyzer:
-    def __init__(self, messages: List[Dict]):
+    def __init__(self, messages: Iterable[Dict], cache_size: int = RESULT_CACHE_SIZE,
+                 cache_bytes: int = RESULT_CACHE_BYTES):
+        # Any iterable of messages works, including WhatsAppParser.iter_messages();
+        # anything that is not already a MessageStore is packed into one.
+        if not isinstance(messages, MessageStore):
+            messages = MessageStore.from_messages(messages)
         self.messages = messages
-    
+        # Trigram indexes built by build_index(), keyed by case sensitivity
+        self.indexes = {}
+
+        # Changes whenever the messages do, so cached results of the old
+        # messages are never returned
+        self.version = 0
+        # LRU cache of results keyed by (phrase, case_sensitive, version),
+        # bounded by both the number of results and their total size
+        self.cache_size = cache_size
+        self.cache_bytes = cache_bytes
+        self.result_cache = OrderedDict()
+        self.cached_bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Guards the cache and the lazily built search text and indexes, so
+        # queries from several threads can count at the same time
+        self.lock = threading.Lock()
+
+    def build_index(self, case_sensitive: bool = False) -> TrigramIndex:
+        """Index the messages so later queries only scan candidate messages.
+
+        Worth it when many queries run against the same messages; counts
+        are the same with or without the index.
+        """
+        with self.lock:
+            if case_sensitive not in self.indexes:
+                text, offsets = self._search_text(case_sensitive)
+                with span('build index', messages=len(self.messages)):
+                    self.indexes[case_sensitive] = TrigramIndex(text, offsets)
+            return self.indexes[case_sensitive]
+
     def count_phrase(self, phrase: str, case_sensitive: bool = False) -> Dict:
-        """Count occurrences of a phrase per month and track when it was said."""
-        phrase_lower = phrase if case_sensitive else phrase.lower()
-        
-        # Monthly counts
-        monthly_counts = defaultdict(int)
-        
-        # Detailed occurrences (date and time)
-        occurrences = []
-        
-        for msg in self.messages:
-            message_text = msg['message'] if case_sensitive else msg['message'].lower()
-            
-            if phrase_lower in message_text:
+        """Count occurrences of a phrase per month and track when it was said.
+
+        The result's 'cube' holds the hits by day, hour and sender, for
+        other breakdowns without another pass over the messages.
+        """
+        return self.count_phrases([phrase], case_sensitive)[0]
+
+    def count_phrases(self, phrases: List[str], case_sensitive: bool = False) -> List[Dict]:
+        """Count several phrases in a single pass over the messages.
+
+        Returns one result per phrase, in the same format as count_phrase.
+        Results are cached, so repeated queries are free; treat them as
+        read-only. Safe to call from several threads. Raises ValueError for
+        an empty phrase.
+        """
+        _check_phrases(phrases)
+        results = {}
+        with self.lock:
+            version = self.version
+            for phrase in phrases:
+                key = (phrase, case_sensitive, version)
+                if key in self.result_cache:
+                    self.result_cache.move_to_end(key)
+                    results[phrase] = self.result_cache[key]
+                    self.cache_hits += 1
+
+            missing = [phrase for phrase in dict.fromkeys(phrases) if phrase not in results]
+            self.cache_misses += len(missing)
+
+        # Counting only reads the messages, so it runs outside the lock
+        with span('count phrases', phrases=len(missing), cached=len(results),
+                  messages=len(self.messages)):
+            analyses = self._count_phrases(missing, case_sensitive)
+
+        with self.lock:
+            for analysis in analyses:
+                results[analysis['phrase']] = analysis
+                # Results of messages that were replaced meanwhile are not kept
+                if self.version == version:
+                    self._cache_result(analysis, case_sensitive)
+
+        return [results[phrase] for phrase in phrases]
+
+    def cache_info(self) -> Dict[str, int]:
+        """Return hit/miss statistics of the result cache."""
+        with self.lock:
+            return {
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'size': len(self.result_cache),
+                'maxsize': self.cache_size,
+                'bytes': self.cached_bytes,
+                'maxbytes': self.cache_bytes,
+            }
+
+    def _cache_result(self, analysis: Dict, case_sensitive: bool):
+        key = (analysis['phrase'], case_sensitive, self.version)
+        if key in self.result_cache:
+            self.cached_bytes -= self._result_bytes(self.result_cache.pop(key))
+        self.result_cache[key] = analysis
+        self.cached_bytes += self._result_bytes(analysis)
+        # Evict the least recently used results, but always keep the newest
+        while len(self.result_cache) > 1 and (
+                len(self.result_cache) > self.cache_size or self.cached_bytes > self.cache_bytes):
+            _, evicted = self.result_cache.popitem(last=False)
+            self.cached_bytes -= self._result_bytes(evicted)
+
+    @staticmethod
+    def _result_bytes(analysis: Dict) -> int:
+        occurrences, cube = analysis['occurrences'], analysis['cube']
+        # Cubes from _count_phrases() share their timestamps and counts with
+        # the occurrences; those of extend() have arrays of their own
+        shared = sum(array.nbytes for array in (cube.timestamps, cube.hits)
+                     if array is occurrences.timestamp or array is occurrences.count)
+        return occurrences.nbytes + cube.nbytes - shared
+
+    def _count_phrases(self, phrases: List[str], case_sensitive: bool) -> List[Dict]:
+        """Count phrases without looking at the result cache."""
+        if not phrases:
+            return []
+
+        needles = [(p if case_sensitive else p.casefold()).encode('utf-8') for p in phrases]
+
+        with self.lock:
+            store = self.messages
+            index = self.indexes.get(case_sensitive)
+            if not index:
+                text, offsets = self._search_text(case_sensitive)
+        if index:
+            text, offsets = index.text, index.offsets
+            candidate_sets = [index.candidates(n) for n in needles]
+        else:
+            candidate_sets = [None]
+
+        if all(c is not None for c in candidate_sets):
+            # The index narrows the search down to messages holding every
+            # trigram of some phrase
+            candidates = np.unique(np.concatenate(candidate_sets))
+        else:
+            # One combined regex over the whole text buffer finds every message
+            # that contains any phrase; only those are counted phrase by phrase.
+            # Phrases never contain SEPARATOR, so no match spans two messages.
+            alternatives = sorted(set(needles), key=len, reverse=True)
+            any_phrase = re.compile(b'|'.join(re.escape(n) for n in alternatives))
+            positions = np.fromiter((m.start() for m in any_phrase.finditer(text)), dtype=np.int64)
+            candidates = np.unique(np.searchsorted(offsets, positions, side='right') - 1)
+
+        hits = [([], []) for _ in phrases]
+        starts = offsets[candidates].tolist()
+        ends = (offsets[candidates + 1] - 1).tolist()
+        for i, start, end in zip(candidates.tolist(), starts, ends):
+            message_text = text[start:end]
+            for needle, (indices, counts) in zip(needles, hits):
                 # Count occurrences in this message
-                count = message_text.count(phrase_lower)
-                
-                # Get year-month key
-                year_month = msg['datetime'].strftime('%Y-%m')
-                monthly_counts[year_month] += count
-                
-                # Store each occurrence
-                for _ in range(count):
-                    occurrences.append({
-                        'datetime': msg['datetime'],
-                        'sender': msg['sender']
-                    })
-        
-        # Sort monthly counts by date
-        sorted_monthly = dict(sorted(monthly_counts.items()))
-        
+                count = message_text.count(needle)
+                if count:
+                    indices.append(i)
+                    counts.append(count)
+
+        results = []
+        for phrase, (indices, counts) in zip(phrases, hits):
+            indices = np.array(indices, dtype=np.int64)
+            counts = np.array(counts, dtype=np.int64)
+
+            # Messages are normally already in time order; the stable sort
+            # keeps message order for equal timestamps if they are not
+            timestamps = store.timestamps[indices]
+            order = np.argsort(timestamps, kind='stable')
+            occurrences = Occurrences(indices[order], counts[order], timestamps[order])
+
+            results.append({
+                'phrase': phrase,
+                'total_count': int(counts.sum()),
+                'monthly_counts': self._monthly_counts(timestamps, counts),
+                'occurrences': occurrences,
+                'cube': PhraseCube(occurrences.timestamp, store.sender_codes[occurrences.index],
+                                   occurrences.count, store.senders)
+            })
+
+        return results
+
+    def extend(self, messages: Iterable[Dict], replace_last: bool = False):
+        """Append new messages and bring the cached results up to date.
+
+        Only the new messages are scanned; their counts are added to every
+        result in the cache, so count_phrases() answers those phrases
+        without a recount. With ``replace_last`` the first new message
+        replaces the current last one, as with the result of
+        WhatsAppParser.parse_tail(), and that message's old counts are
+        subtracted first.
+        """
+        if not isinstance(messages, MessageStore):
+            messages = MessageStore.from_messages(messages)
+
+        with self.lock:
+            current = self.messages
+            cached = [(key[1], analysis) for key, analysis in self.result_cache.items()
+                      if key[2] == self.version]
+        kept = len(current) - 1 if replace_last and len(current) else len(current)
+        replaced = current.slice(kept, len(current))
+
+        updated = []
+        for case_sensitive in (False, True):
+            analyses = [analysis for case, analysis in cached if case == case_sensitive]
+            if not analyses:
+                continue
+            phrases = [analysis['phrase'] for analysis in analyses]
+            removed = ChatAnalyzer(replaced).count_phrases(phrases, case_sensitive)
+            added = ChatAnalyzer(messages).count_phrases(phrases, case_sensitive)
+            updated += [
+                (case_sensitive, self._merge_analysis(analysis, old, new, kept))
+                for analysis, old, new in zip(analyses, removed, added)
+            ]
+
+        combined = MessageStore.concat([current.slice(0, kept), messages])
+        with self.lock:
+            self.messages = combined
+            self.indexes = {}
+            self.version += 1
+            # Results of the old messages can no longer be hit
+            self.result_cache.clear()
+            self.cached_bytes = 0
+            for case_sensitive, analysis in updated:
+                self._cache_result(analysis, case_sensitive)
+
+    @staticmethod
+    def _merge_analysis(analysis: Dict, removed: Dict, added: Dict, kept: int) -> Dict:
+        """Subtract the counts of a removed last message and add new ones.
+
+        ``kept`` is the number of old messages kept, which is also the index
+        of the first new message.
+        """
+        monthly_counts = dict(analysis['monthly_counts'])
+        occurrences = analysis['occurrences']
+
+        if removed['total_count']:
+            for month, count in removed['monthly_counts'].items():
+                monthly_counts[month] -= count
+                if not monthly_counts[month]:
+                    del monthly_counts[month]
+            occurrences = occurrences.take(occurrences.index < kept)
+
+        for month, count in added['monthly_counts'].items():
+            monthly_counts[month] = monthly_counts.get(month, 0) + count
+        new = added['occurrences']
+        occurrences = Occurrences.concat([
+            occurrences, Occurrences(new.index + kept, new.count, new.timestamp)])
+
         return {
-            'phrase': phrase,
+            'phrase': analysis['phrase'],
             'total_count': sum(monthly_counts.values()),
-            'monthly_counts': sorted_monthly,
-            'occurrences': sorted(occurrences, key=lambda x: x['datetime'])
+            'monthly_counts': dict(sorted(monthly_counts.items())),
+            'occurrences': occurrences,
+            'cube': PhraseCube.combine([analysis['cube'], added['cube'], removed['cube']], [1, 1, -1])
         }
-    
-    def get_summary(self, phrase: str, case_sensitive: bool = False) -> str:
-        """Generate a text summary of phrase usage."""
-        analysis = self.count_phrase(phrase, case_sensitive)
-        
+
+    def _search_text(self, case_sensitive: bool) -> Tuple[bytes, np.ndarray]:
+        """Return the text buffer to search and the offsets of its messages.
+
+        Call with the lock held, so the folded copy is only built once.
+        """
+        store = self.messages
+        if case_sensitive:
+            return store.text, store.offsets
+        # Built once per store and shared by every case-insensitive query
+        return store.folded()
+
+    @staticmethod
+    def _monthly_counts(timestamps: np.ndarray, counts: np.ndarray) -> Dict[str, int]:
+        """Sum hit counts per calendar month, keyed by 'YYYY-MM' in date order."""
+        months = timestamps.astype('datetime64[s]').astype('datetime64[M]')
+        unique_months, month_of_hit = np.unique(months, return_inverse=True)
+        totals = np.bincount(month_of_hit, weights=counts, minlength=len(unique_months))
+        labels = np.datetime_as_string(unique_months, unit='M')
+        return {str(label): int(total) for label, total in zip(labels, totals)}
+
+    def get_summary(self, phrase: str, case_sensitive: bool = False, analysis: Dict = None) -> str:
+        """Generate a text summary of phrase usage.
+
+        Pass the phrase's ``analysis`` if it was already computed.
+        """
+        if analysis is None:
+            analysis = self.count_phrase(phrase, case_sensitive)
+
         summary = f"Summary for phrase: '{phrase}'\n"
         summary += f"{'='*50}\n"
         summary += f"Total occurrences: {analysis['total_count']}\n\n"
-        
+
         summary += "Monthly breakdown:\n"
         for month, count in analysis['monthly_counts'].items():
             summary += f"  {month}: {count} times\n"
-        
-        return summary
\ No newline at end of file
+
+        return summary
@@ -0,0 +1,246 @@
+"""Persistent on-disk cache of parsed chat files."""
+import hashlib
+import os
+import sys
+import tempfile
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.parser import PARSER_VERSION, Checkpoint, WhatsAppParser, open_chat
+from src.store import MessageStore
+
+
+CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+    'whatsapp-chat-analyzer',
+)
+
+# Total size of all snapshots before the least recently used ones are evicted
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+SNAPSHOT_SUFFIX = '.npz'
+HEAD_SUFFIX = '.head'
+
+# Leading bytes that identify a chat across re-exports
+HEAD_BYTES = 4096
+
+# Bytes read at a time while hashing file contents
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def fingerprint(file_path: str, progress: Optional[Callable[[int], None]] = None) -> str:
+    """Identify a chat file by path, size, mtime, content and parser version.
+
+    ``progress`` is called with the bytes hashed so far after each block;
+    an exception raised by it aborts hashing.
+    """
+    stat = os.stat(file_path)
+
+    content = hashlib.blake2b(digest_size=16)
+    hashed = 0
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+            content.update(block)
+            hashed += len(block)
+            if progress:
+                progress(hashed)
+
+    key = hashlib.sha256()
+    for part in (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns,
+                 content.hexdigest(), PARSER_VERSION):
+        key.update(f"{part}\0".encode('utf-8'))
+    return key.hexdigest()
+
+
+class ParseCache:
+    """Snapshots of parsed chat files, stored as MessageStore files on disk.
+
+    Entries are keyed by fingerprint(), so a changed file or a new parser
+    version simply misses. Reading an entry refreshes its mtime, and when
+    the cache grows past ``max_bytes`` the entries with the oldest mtime
+    are removed first.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def load(self, file_path: str, workers: int = 1,
+             progress: Optional[Callable[[int], None]] = None,
+             on_tail: Optional[Callable[[List[Dict]], None]] = None) -> MessageStore:
+        """Return the parsed messages of a file, parsing it only on a cache miss.
+
+        ``workers`` is passed to WhatsAppParser.parse_store() for a full parse,
+        and ``progress`` to the WhatsAppParser. When the file extends a cached
+        export and only its tail is parsed, ``on_tail`` is called with the
+        tail's messages, the first of which replaces the cached last message.
+        """
+        # Hashing is far faster than parsing, so it only gives the caller a
+        # chance to cancel; the bytes parsed stay at 0 until parsing starts
+        key = fingerprint(file_path, (lambda hashed: progress(0)) if progress else None)
+
+        entry = self.get(key)
+        if entry is not None:
+            return entry[0]
+
+        store, checkpoint = self._parse(file_path, workers, progress, on_tail)
+        self.put(key, store, checkpoint)
+        self._write_head(file_path, key)
+        return store
+
+    def _parse(self, file_path: str, workers: int,
+               progress: Optional[Callable[[int], None]] = None,
+               on_tail: Optional[Callable[[List[Dict]], None]] = None) -> Tuple[MessageStore, Optional[Checkpoint]]:
+        """Parse a file, only reading its new tail if it extends a cached export."""
+        parser = WhatsAppParser(file_path, progress)
+
+        previous = self._read_head(file_path)
+        if previous is not None:
+            old_store, checkpoint = previous
+            tail = parser.parse_tail(checkpoint)
+            if tail is not None:
+                if on_tail:
+                    on_tail(tail)
+                # The reparsed last message replaces the cached one
+                store = MessageStore.concat([old_store.slice(0, len(old_store) - 1),
+                                             MessageStore.from_messages(tail)])
+                return store, parser.checkpoint
+
+        store = parser.parse_store(workers)
+        return store, parser.checkpoint
+
+    def get(self, key: str) -> Optional[Tuple[MessageStore, Optional[Checkpoint]]]:
+        """Return the cached store and parse checkpoint for a key, if any."""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as file, np.load(file, allow_pickle=False) as data:
+                store = MessageStore.from_arrays(data)
+                checkpoint = None
+                if 'checkpoint_offset' in data and len(store):
+                    format = int(data['checkpoint_format'])
+                    checkpoint = Checkpoint(
+                        int(data['checkpoint_offset']),
+                        str(data['checkpoint_hash']),
+                        None if format < 0 else format,
+                        store[len(store) - 1],
+                    )
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError):
+            # Unreadable or truncated snapshot: drop it and reparse
+            self._remove(path)
+            return None
+
+        # Mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return store, checkpoint
+
+    def put(self, key: str, store: MessageStore, checkpoint: Optional[Checkpoint] = None):
+        arrays = store.to_arrays()
+        if checkpoint is not None:
+            arrays['checkpoint_offset'] = np.array(checkpoint.offset, dtype=np.int64)
+            arrays['checkpoint_hash'] = np.array(checkpoint.prefix_hash)
+            arrays['checkpoint_format'] = np.array(
+                -1 if checkpoint.format is None else checkpoint.format, dtype=np.int64)
+
+        tmp_path = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write to a temporary file first so readers never see a partial snapshot
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as file:
+                np.savez(file, **arrays)
+            os.replace(tmp_path, self._entry_path(key))
+        except OSError as e:
+            # The cache is an optimization only; never fail a parse because of it
+            if tmp_path:
+                self._remove(tmp_path)
+            print(f"Could not write parse cache: {e}", file=sys.stderr)
+            return
+
+        self._evict()
+
+    def _read_head(self, file_path: str) -> Optional[Tuple[MessageStore, Checkpoint]]:
+        """Find the cached parse of an earlier export that starts like this file."""
+        try:
+            with open(self._head_path(file_path), 'r', encoding='utf-8') as file:
+                key = file.read().strip()
+        except (OSError, ValueError):
+            return None
+
+        entry = self.get(key)
+        if entry is None or entry[1] is None:
+            return None
+        return entry
+
+    def _write_head(self, file_path: str, key: str):
+        try:
+            with open(self._head_path(file_path), 'w', encoding='utf-8') as file:
+                file.write(key)
+        except OSError:
+            pass
+
+    def _head_path(self, file_path: str) -> str:
+        """Index file shared by every export that begins with the same bytes.
+
+        Re-exports of a growing chat keep their beginning, whatever the file
+        is called, so the first HEAD_BYTES identify the chat. For a zip these
+        are the first bytes of the chat inside it.
+        """
+        head = hashlib.blake2b(digest_size=16)
+        with open_chat(file_path) as file:
+            head.update(file.read(HEAD_BYTES))
+        head.update(str(PARSER_VERSION).encode('utf-8'))
+        return os.path.join(self.cache_dir, head.hexdigest() + HEAD_SUFFIX)
+
+    def clear(self):
+        for path, _, _ in self._entries():
+            self._remove(path)
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith(HEAD_SUFFIX):
+                self._remove(os.path.join(self.cache_dir, name))
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+
+        # Remove least recently used entries first
+        for path, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _entries(self):
+        """Yield (path, mtime, size) for every snapshot in the cache directory."""
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(SNAPSHOT_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            yield path, stat.st_mtime, stat.st_size
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + SNAPSHOT_SUFFIX)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
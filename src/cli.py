@@ -0,0 +1,181 @@
+"""Command-line interface for batch analysis without the GUI."""
+import argparse
+import csv
+import json
+import sys
+from typing import Dict, List
+
+from src.analyzer import ChatAnalyzer, PhraseCounter
+from src.cache import CACHE_DIR
+from src.ingest import load_files, stream_files
+from src.instrumentation import Tracer, profiled, set_tracer, span, traced_memory
+
+
+def analysis_to_dict(analysis: Dict) -> Dict:
+    """Convert a count_phrase result into plain JSON-serializable data."""
+    days, counts = analysis['occurrences'].daily_counts()
+    cube = analysis['cube']
+    weeks, weekly = cube.by_week()
+    return {
+        'phrase': analysis['phrase'],
+        'total_count': analysis['total_count'],
+        'monthly_counts': analysis['monthly_counts'],
+        'weekly_counts': {str(week): int(count) for week, count in zip(weeks, weekly) if count},
+        'daily_counts': {str(day): int(count) for day, count in zip(days, counts)},
+        'hourly_counts': cube.by_hour().tolist(),
+        'sender_counts': cube.by_sender(),
+    }
+
+
+def write_json(report: Dict, out):
+    json.dump(report, out, indent=2, ensure_ascii=False)
+    out.write("\n")
+
+
+def write_csv(report: Dict, out):
+    """One row per phrase and month."""
+    writer = csv.writer(out)
+    writer.writerow(['phrase', 'month', 'count'])
+    for analysis in report['phrases']:
+        for month, count in analysis['monthly_counts'].items():
+            writer.writerow([analysis['phrase'], month, count])
+
+
+def split_phrases(values: List[str]) -> List[str]:
+    """Accept repeated --phrase options as well as comma-separated lists."""
+    return [p.strip() for value in values for p in value.split(',') if p.strip()]
+
+
+def run_analyze(args) -> int:
+    phrases = split_phrases(args.phrase)
+    if not phrases:
+        print("No valid phrases given.", file=sys.stderr)
+        return 2
+
+    tracer = set_tracer(Tracer())
+    with traced_memory(args.trace_memory), profiled(args.profile):
+        report = build_report(args, phrases)
+
+    if args.trace:
+        tracer.write(args.trace)
+    if args.timings:
+        print(tracer.summary(), file=sys.stderr)
+
+    writer = write_csv if args.format == 'csv' else write_json
+    if args.output == '-':
+        writer(report, sys.stdout)
+    else:
+        with open(args.output, 'w', encoding='utf-8', newline='') as out:
+            writer(report, out)
+    return 0
+
+
+def build_report(args, phrases: List[str]) -> Dict:
+    if args.stream:
+        message_count, duplicate_count, analyses = count_streaming(args.files, phrases, args.case_sensitive)
+    else:
+        messages, duplicate_count = load_files(
+            args.files, cache_dir=None if args.no_cache else args.cache_dir, workers=args.workers)
+        analyzer = ChatAnalyzer(messages)
+        analyses = analyzer.count_phrases(phrases, args.case_sensitive)
+        message_count = len(messages)
+
+    report = {
+        'files': args.files,
+        'messages': message_count,
+        'duplicates_removed': duplicate_count,
+        'case_sensitive': args.case_sensitive,
+        'phrases': [analysis_to_dict(analysis) for analysis in analyses],
+    }
+
+    if args.charts:
+        # matplotlib is only loaded when charts are requested
+        from src.visualizer import render_charts
+        rendered = render_charts(analyses, args.charts, dpi=args.dpi, fmt=args.chart_format,
+                                 preview=args.preview, workers=args.workers,
+                                 views=split_phrases([args.views]))
+        report['charts'] = rendered
+    return report
+
+
+def count_streaming(files: List[str], phrases: List[str], case_sensitive: bool):
+    """Count phrases while reading the files, without loading all messages.
+
+    Returns the number of unique messages, the number of duplicates and
+    the analyses.
+    """
+    stream = stream_files(files)
+    counter = PhraseCounter(phrases, case_sensitive)
+    with span('stream and count', files=len(files), phrases=len(phrases)) as counts:
+        for msg in stream:
+            counter.add(msg)
+        counts.update(messages=stream.messages, duplicates=stream.duplicates)
+    return stream.messages, stream.duplicates, counter.results()
+
+
+def run_serve(args) -> int:
+    import asyncio
+    from src.server import QueryServer
+
+    # The server runs indefinitely, so spans are timed but never kept
+    set_tracer(Tracer(record=False))
+    cache_dir = None if args.no_cache else args.cache_dir
+    messages, duplicate_count = load_files(args.files, cache_dir=cache_dir, workers=args.workers)
+    server = QueryServer(messages, args.files, duplicate_count, render_workers=args.workers,
+                         cache_dir=cache_dir)
+    if args.index:
+        server.build_index(case_sensitive=False)
+        server.build_index(case_sensitive=True)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m src', description="WhatsApp chat analyzer")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    analyze = commands.add_parser('analyze', help="count phrases in chat exports")
+    analyze.add_argument('files', nargs='+', help="exported chat files (.txt, or .zip as exported)")
+    analyze.add_argument('-p', '--phrase', action='append', required=True,
+                         help="phrase to count; repeat or separate with commas")
+    analyze.add_argument('-c', '--case-sensitive', action='store_true')
+    analyze.add_argument('-f', '--format', choices=('json', 'csv'), default='json')
+    analyze.add_argument('-o', '--output', default='-', help="output file (default: stdout)")
+    analyze.add_argument('--charts', metavar='DIR', help="also render charts into DIR")
+    analyze.add_argument('--chart-format', choices=('png', 'svg'), default='png')
+    analyze.add_argument('--views', default='monthly,timeline',
+                         help="comma-separated charts per phrase: monthly, timeline, weekly, hourly, senders")
+    analyze.add_argument('--dpi', type=int, default=300)
+    analyze.add_argument('--preview', action='store_true', help="fast low-resolution charts")
+    analyze.add_argument('--workers', type=int, help="worker processes (default: CPU count)")
+    analyze.add_argument('--cache-dir', default=CACHE_DIR)
+    analyze.add_argument('--no-cache', action='store_true', help="do not read or write the parse cache")
+    analyze.add_argument('--stream', action='store_true',
+                         help="count while reading, for chats larger than memory (files must be in time order)")
+    analyze.add_argument('--timings', action='store_true', help="print per-stage timings to stderr")
+    analyze.add_argument('--trace', metavar='FILE', help="write a Chrome trace of the stages to FILE")
+    analyze.add_argument('--trace-memory', action='store_true',
+                         help="also record each stage's peak Python allocations (slower)")
+    analyze.add_argument('--profile', metavar='FILE', help="run under cProfile and dump the stats to FILE")
+    analyze.set_defaults(handler=run_analyze)
+
+    serve = commands.add_parser('serve', help="keep chats in memory and answer queries over HTTP")
+    serve.add_argument('files', nargs='+', help="exported chat files (.txt, or .zip as exported)")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--index', action='store_true',
+                       help="build trigram indexes at startup for faster new queries")
+    serve.add_argument('--workers', type=int, help="worker processes (default: CPU count)")
+    serve.add_argument('--cache-dir', default=CACHE_DIR)
+    serve.add_argument('--no-cache', action='store_true', help="do not read or write the parse cache")
+    serve.set_defaults(handler=run_serve)
+
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
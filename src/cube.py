@@ -0,0 +1,100 @@
+"""Hit counts of a phrase by day, week, month, hour of day and sender."""
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from src.store import SECONDS_PER_DAY
+
+
+SECONDS_PER_HOUR = 60 * 60
+HOURS = 24
+
+
+class PhraseCube:
+    """Hit counts of a phrase that can be rolled up by day, week, month, hour or sender.
+
+    A cube holds the phrase's hits (epoch seconds, sender code and count per
+    message), which count_phrases() has at hand anyway, and the sender of
+    each code in ``senders``. Every rollup below is a single bincount over
+    the hits, so no (day, hour, sender) array is ever built and a cube only
+    takes the memory of its hits, in the cache or when sent to a worker.
+    """
+
+    def __init__(self, timestamps: np.ndarray, sender_codes: np.ndarray,
+                 counts: np.ndarray, senders: List[str]):
+        self.timestamps = timestamps
+        self.sender_codes = sender_codes
+        self.hits = counts
+        self.senders = list(senders)
+
+    @classmethod
+    def combine(cls, cubes: List['PhraseCube'], signs: List[int] = None) -> 'PhraseCube':
+        """Add up the hits of several cubes, whose senders may differ.
+
+        ``signs`` (1 or -1 per cube) allows subtracting, e.g. the counts of a
+        message that was replaced. Senders are matched by name.
+        """
+        signs = signs or [1] * len(cubes)
+        senders = list(dict.fromkeys(name for cube in cubes for name in cube.senders))
+        position = {name: i for i, name in enumerate(senders)}
+
+        remaps = [np.array([position[name] for name in cube.senders] or [0], dtype=np.int32)
+                  for cube in cubes]
+        return cls(
+            np.concatenate([cube.timestamps for cube in cubes]),
+            np.concatenate([remap[cube.sender_codes] for cube, remap in zip(cubes, remaps)]),
+            np.concatenate([sign * cube.hits for cube, sign in zip(cubes, signs)]),
+            senders,
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + self.sender_codes.nbytes + self.hits.nbytes
+
+    def _sum_by(self, keys: np.ndarray, length: int = 0) -> np.ndarray:
+        """Sum the hits per key (small non-negative integers)."""
+        # Float sums of integer counts are exact far beyond any chat's size
+        return np.bincount(keys, weights=self.hits, minlength=length).astype(np.int64)
+
+    def by_day(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return every day (datetime64[D]) from the first to the last hit and the hits on each."""
+        if not len(self.hits):
+            return np.zeros(0, dtype='datetime64[D]'), np.zeros(0, dtype=np.int64)
+        days = self.timestamps // SECONDS_PER_DAY
+        first = int(days.min())
+        totals = self._sum_by(days - first)
+        return (first + np.arange(len(totals))).astype('datetime64[D]'), totals
+
+    def by_week(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the Monday (datetime64[D]) of each week in the range and its hits."""
+        if not len(self.hits):
+            return np.zeros(0, dtype='datetime64[D]'), np.zeros(0, dtype=np.int64)
+        # Day 0 of the epoch was a Thursday
+        days = self.timestamps // SECONDS_PER_DAY
+        mondays = days - (days + 3) % 7
+        first = int(mondays.min())
+        totals = self._sum_by((mondays - first) // 7)
+        return (first + 7 * np.arange(len(totals))).astype('datetime64[D]'), totals
+
+    def by_month(self) -> Dict[str, int]:
+        """Return the hits per 'YYYY-MM' month that has any, in date order."""
+        # Rolled up from the days, which are far fewer than the hits
+        days, daily = self.by_day()
+        unique_months, month_of_day = np.unique(days.astype('datetime64[M]'), return_inverse=True)
+        totals = np.zeros(len(unique_months), dtype=np.int64)
+        np.add.at(totals, month_of_day.reshape(-1), daily)
+        labels = np.datetime_as_string(unique_months, unit='M')
+        return {str(label): int(total) for label, total in zip(labels, totals) if total}
+
+    def by_hour(self) -> np.ndarray:
+        """Return the hits per hour of the day (24 values)."""
+        return self._sum_by(self.timestamps % SECONDS_PER_DAY // SECONDS_PER_HOUR, HOURS)
+
+    def by_sender(self) -> Dict[str, int]:
+        """Return the hits per sender who used the phrase, most frequent first."""
+        totals = self._sum_by(self.sender_codes, len(self.senders))
+        order = np.argsort(-totals, kind='stable')
+        return {self.senders[i]: int(totals[i]) for i in order if totals[i]}
+
+    def total(self) -> int:
+        return int(self.hits.sum(dtype=np.int64))
@@ -0,0 +1,104 @@
+"""Trigram index for fast repeated phrase queries."""
+from typing import Optional
+
+import numpy as np
+
+from src.store import SEPARATOR
+
+
+# Text bytes indexed per step while building. A block needs about 30 bytes
+# of temporaries per text byte, so this keeps them small next to the keys
+BUILD_BLOCK_BYTES = 1024 * 1024
+
+
+def _run_starts(values: np.ndarray) -> np.ndarray:
+    """Return the index of the first element of each run of equal sorted values."""
+    if not len(values):
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+
+
+class TrigramIndex:
+    """Postings lists of byte trigrams over a buffer of separator-terminated messages.
+
+    For every three-byte sequence in the text, the index lists the messages
+    that contain it. A phrase can only occur in messages that contain all
+    of its trigrams, so intersecting those lists gives a small candidate
+    set that is then verified with an exact substring count.
+    """
+
+    def __init__(self, text: bytes, offsets: np.ndarray):
+        self.text = text
+        self.offsets = offsets
+
+        blocks = []
+        start = 0
+        message_count = len(offsets) - 1
+        while start < message_count:
+            # Whole messages only, so no trigram is split between blocks
+            stop = int(np.searchsorted(offsets, offsets[start] + BUILD_BLOCK_BYTES, side='right'))
+            stop = min(max(stop - 1, start + 1), message_count)
+            blocks.append(self._block_keys(start, stop))
+            start = stop
+
+        # Keys are (trigram << 32 | message), so sorting groups messages by trigram.
+        # Peak memory is about twice the keys, while they are concatenated;
+        # blocks are freed before the in-place sort, which needs no copy
+        keys = np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.uint64)
+        del blocks
+        keys.sort()
+        # The uint32 cast keeps the low half; the shift is done in place
+        self.messages = keys.astype(np.uint32)
+        keys >>= np.uint64(32)
+        trigrams = keys.astype(np.uint32)
+        del keys
+        self.starts = np.append(_run_starts(trigrams), len(self.messages))
+        self.trigrams = trigrams[self.starts[:-1]]
+
+    def _block_keys(self, start: int, stop: int) -> np.ndarray:
+        """Return the unique (trigram, message) keys of messages ``start`` to ``stop - 1``."""
+        first, last = int(self.offsets[start]), int(self.offsets[stop])
+        data = np.frombuffer(self.text, dtype=np.uint8, count=last - first, offset=first)
+        if len(data) < 3:
+            return np.zeros(0, dtype=np.uint64)
+
+        message_of_byte = np.repeat(np.arange(start, stop, dtype=np.uint32),
+                                    np.diff(self.offsets[start:stop + 1]))
+        a, b, c = data[:-2], data[1:-1], data[2:]
+        separator = SEPARATOR[0]
+        valid = (a != separator) & (b != separator) & (c != separator)
+
+        # Widened to 64 bits only for the valid positions
+        trigrams = (a.astype(np.uint32) << 16) | (b.astype(np.uint32) << 8) | c
+        keys = trigrams[valid].astype(np.uint64) << np.uint64(32)
+        keys |= message_of_byte[:-2][valid]
+        keys.sort()
+        return keys[_run_starts(keys)]
+
+    def postings(self, trigram: int) -> np.ndarray:
+        """Return the sorted indices of the messages containing a trigram."""
+        i = np.searchsorted(self.trigrams, trigram)
+        if i == len(self.trigrams) or self.trigrams[i] != trigram:
+            return np.zeros(0, dtype=np.uint32)
+        return self.messages[self.starts[i]:self.starts[i + 1]]
+
+    def candidates(self, needle: bytes) -> Optional[np.ndarray]:
+        """Return the messages that may contain ``needle``.
+
+        Returns None for needles shorter than three bytes, which the index
+        cannot narrow down.
+        """
+        if len(needle) < 3:
+            return None
+
+        trigrams = {(needle[i] << 16) | (needle[i + 1] << 8) | needle[i + 2]
+                    for i in range(len(needle) - 2)}
+        # Intersect the shortest lists first
+        lists = sorted((self.postings(t) for t in trigrams), key=len)
+
+        result = lists[0]
+        for postings in lists[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, postings, assume_unique=True)
+        return result.astype(np.int64)
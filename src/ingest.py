@@ -0,0 +1,240 @@
+"""Load several WhatsApp chat exports and merge them into one corpus."""
+import heapq
+import os
+from itertools import accumulate
+
+import numpy as np
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.analyzer import ChatAnalyzer
+from src.cache import CACHE_DIR, ParseCache
+from src.instrumentation import span
+from src.parser import Cancelled, PoolProgress, WhatsAppParser, chat_size, worker_progress
+from src.store import MessageStore, message_fingerprint
+
+
+def load_file(file_path: str, cache_dir: Optional[str] = CACHE_DIR, workers: int = 1,
+              progress: Optional[Callable[[int], None]] = None,
+              on_tail: Optional[Callable[[List[Dict]], None]] = None) -> MessageStore:
+    """Parse one chat file, going through the parse cache unless ``cache_dir`` is None.
+
+    A large file is split across ``workers`` processes. ``progress`` is
+    called with the number of bytes parsed so far, and ``on_tail`` as in
+    ParseCache.load().
+    """
+    if cache_dir is None:
+        return WhatsAppParser(file_path, progress).parse_store(workers)
+    return ParseCache(cache_dir).load(file_path, workers, progress, on_tail)
+
+
+def load_files(file_paths: List[str], cache_dir: Optional[str] = CACHE_DIR,
+               workers: Optional[int] = None,
+               progress: Optional[Callable[[int, int], None]] = None,
+               on_tail: Optional[Callable[[List[Dict]], None]] = None) -> Tuple[MessageStore, int]:
+    """Parse chat files concurrently and merge them into one time-ordered store.
+
+    Each file is parsed exactly once, in a separate process when there is
+    more than one; a single file is instead split into chunks that are
+    parsed in parallel. Messages that appear in several files (same datetime,
+    sender and text) are kept once. Returns the merged store and the number
+    of duplicates removed.
+
+    ``progress`` is called with the bytes parsed so far and the total size
+    of the files, as parsing goes, also in worker processes. An exception
+    raised by it (such as Cancelled) aborts loading, and stops the workers.
+    For a single file, ``on_tail`` is passed on to ParseCache.load().
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    sizes = [chat_size(file_path) for file_path in file_paths]
+    total = sum(sizes)
+    report = (lambda done: progress(done, total)) if progress else None
+
+    with span('parse files', files=len(file_paths), bytes=total) as counts:
+        if len(file_paths) == 1:
+            stores = [load_file(file_paths[0], cache_dir, workers, report, on_tail)]
+        elif workers > 1:
+            stores = _load_in_pool(file_paths, sizes, cache_dir, workers, report)
+        else:
+            stores = []
+            for file_path, done in zip(file_paths, accumulate([0] + sizes)):
+                file_report = (lambda parsed, done=done: report(done + parsed)) if report else None
+                stores.append(load_file(file_path, cache_dir, progress=file_report))
+        counts['messages'] = sum(len(store) for store in stores)
+        if report:
+            report(total)
+
+    with span('merge and deduplicate') as counts:
+        merged, duplicate_count = merge_stores(stores)
+        counts.update(messages=len(merged), duplicates=duplicate_count)
+    return merged, duplicate_count
+
+
+def load_analyzer(file_paths: List[str], analyzer: Optional[ChatAnalyzer] = None,
+                  cache_dir: Optional[str] = CACHE_DIR, workers: Optional[int] = None,
+                  progress: Optional[Callable[[int, int], None]] = None) -> Tuple[ChatAnalyzer, int]:
+    """Load chat files into a ChatAnalyzer, reusing ``analyzer`` for a grown export.
+
+    ``analyzer`` holds an earlier load of the same files, if any. When the
+    parse cache only had to read the tail of a re-exported chat and every
+    earlier message is unchanged, the tail is handed to analyzer.extend(),
+    so its cached results are updated instead of recounted; otherwise a new
+    analyzer is returned. Returns the analyzer and the number of duplicates
+    removed, as load_files() does.
+    """
+    tails = []
+    messages, duplicate_count = load_files(file_paths, cache_dir, workers, progress, tails.append)
+
+    if analyzer is not None and tails:
+        kept = len(analyzer.messages) - 1
+        # Taken from the merged store rather than the parsed tail, so
+        # duplicates are dropped the same way as in a full load
+        if kept >= 0 and messages.shares_prefix(analyzer.messages, kept):
+            with span('extend analysis', messages=len(messages) - kept):
+                analyzer.extend(messages.slice(kept, len(messages)), replace_last=True)
+            return analyzer, duplicate_count
+    return ChatAnalyzer(messages), duplicate_count
+
+
+class MergedStream:
+    """Merge time-ordered message streams into one, dropping duplicates.
+
+    Duplicates share a datetime, so with the inputs merged in time order only
+    the messages of the current datetime need to be remembered. Messages with
+    equal datetimes keep their input order, so the result is the same as
+    load_files() gives, without ever holding all messages. Raises ValueError
+    if an input turns out not to be in time order.
+    """
+
+    def __init__(self, streams: Iterable[Iterable[Dict]]):
+        self.streams = list(streams)
+        self.messages = 0
+        self.duplicates = 0
+
+    def __iter__(self) -> Iterator[Dict]:
+        current = None
+        seen_messages = set()
+        for msg in heapq.merge(*self.streams, key=lambda m: m['datetime']):
+            if msg['datetime'] != current:
+                if current is not None and msg['datetime'] < current:
+                    raise ValueError(f"Messages are not in time order at {msg['datetime']}")
+                current = msg['datetime']
+                seen_messages.clear()
+
+            msg_id = message_fingerprint((msg['sender'] + '\0').encode('utf-8'),
+                                         (msg['message'] + '\0').encode('utf-8'))
+            if msg_id in seen_messages:
+                self.duplicates += 1
+                continue
+            seen_messages.add(msg_id)
+            self.messages += 1
+            yield msg
+
+
+def stream_files(file_paths: List[str]) -> MergedStream:
+    """Stream the messages of several chat files, merged and deduplicated.
+
+    Files are read line by line and never cached, so memory use does not
+    depend on their size.
+    """
+    return MergedStream(WhatsAppParser(file_path).iter_messages() for file_path in file_paths)
+
+
+def _load_in_pool(file_paths: List[str], sizes: List[int], cache_dir: Optional[str],
+                  workers: int, report: Optional[Callable[[int], None]]) -> List[MessageStore]:
+    """Load each file in its own worker process, reporting the bytes parsed by all."""
+    shared = PoolProgress()
+    with shared.executor(min(workers, len(file_paths))) as executor:
+        futures = {executor.submit(_load_in_worker, file_path, size, cache_dir): i
+                   for i, (file_path, size) in enumerate(zip(file_paths, sizes))}
+        return shared.gather(executor, futures, report)
+
+
+def _load_in_worker(file_path: str, size: int, cache_dir: Optional[str]) -> MessageStore:
+    progress = worker_progress()
+    store = load_file(file_path, cache_dir, progress=progress)
+    # A cache hit parses nothing, so the file's bytes are counted at the end
+    progress(size)
+    return store
+
+
+def merge_stores(stores: List[MessageStore]) -> Tuple[MessageStore, int]:
+    """Merge per-file stores, dropping duplicates, and count what was dropped.
+
+    Each store is normally in time order already, so the stores are merged
+    as sorted runs rather than sorted together; a store that is not in
+    order is sorted on its own first. Messages with equal timestamps keep
+    file order, then their order within the file. A message is a duplicate
+    if one with the same timestamp and fingerprint (see
+    MessageStore.fingerprints) came before it, so as in MergedStream only
+    messages that share a timestamp are compared, and only those are
+    fingerprinted. The kept messages are copied straight from the per-file
+    stores.
+    """
+    # Each store's rows in time order, with their timestamps
+    runs = []
+    for source, store in enumerate(stores):
+        rows = np.arange(len(store))
+        if len(store) and np.any(np.diff(store.timestamps) < 0):
+            rows = np.argsort(store.timestamps, kind='stable')
+        runs.append((store.timestamps[rows], np.full(len(store), source, dtype=np.int32), rows))
+    timestamps, sources, rows = _merge_runs(runs)
+
+    # Only a message with the same timestamp as a neighbour can be a repeat
+    same = timestamps[1:] == timestamps[:-1]
+    is_tied = np.zeros(len(timestamps), dtype=bool)
+    is_tied[1:] |= same
+    is_tied[:-1] |= same
+    tied = np.flatnonzero(is_tied)
+
+    fingerprints = np.empty(len(tied), dtype=np.uint64)
+    for source, store in enumerate(stores):
+        mine = sources[tied] == source
+        fingerprints[mine] = store.fingerprints(rows[tied][mine])
+
+    keep = np.ones(len(timestamps), dtype=bool)
+    current = None
+    seen_messages = set()
+    for i, timestamp, fingerprint in zip(tied.tolist(), timestamps[tied].tolist(), fingerprints.tolist()):
+        if timestamp != current:
+            current = timestamp
+            seen_messages.clear()
+        if fingerprint in seen_messages:
+            keep[i] = False
+        else:
+            seen_messages.add(fingerprint)
+    kept = np.flatnonzero(keep)
+    duplicate_count = len(keep) - len(kept)
+
+    if len(stores) == 1 and not duplicate_count and np.array_equal(rows, np.arange(len(rows))):
+        # Nothing to reorder or drop
+        return stores[0], 0
+    return MessageStore.gather(stores, sources[kept], rows[kept]), duplicate_count
+
+
+def _merge_runs(runs: List[Tuple[np.ndarray, ...]]) -> Tuple[np.ndarray, ...]:
+    """Merge runs of (timestamps, sources, rows) sorted by timestamp into one.
+
+    Runs are merged in pairs, as a tree, and ties keep the run order.
+    """
+    if not runs:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64)
+    while len(runs) > 1:
+        runs = [_merge_two(*runs[i:i + 2]) if i + 1 < len(runs) else runs[i]
+                for i in range(0, len(runs), 2)]
+    return runs[0]
+
+
+def _merge_two(first: Tuple[np.ndarray, ...], second: Tuple[np.ndarray, ...]) -> Tuple[np.ndarray, ...]:
+    # Each element goes after the elements of the other run that sort
+    # before it; ties go to ``first``
+    to_first = np.searchsorted(second[0], first[0], side='left') + np.arange(len(first[0]))
+    to_second = np.searchsorted(first[0], second[0], side='right') + np.arange(len(second[0]))
+    merged = []
+    for a, b in zip(first, second):
+        column = np.empty(len(a) + len(b), dtype=a.dtype)
+        column[to_first] = a
+        column[to_second] = b
+        merged.append(column)
+    return tuple(merged)
@@ -0,0 +1,182 @@
+"""Lightweight per-stage timing and memory instrumentation."""
+import cProfile
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Only Linux exposes the current RSS without extra dependencies
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+class Tracer:
+    """Collects timed spans for the stages of a run.
+
+    Each span records its wall time, optional counts (e.g. messages) and
+    the resident set size of the process when it started and ended, where
+    the platform reports it. While tracemalloc is tracing (see
+    traced_memory()), it also records the peak of traced Python
+    allocations during the span, nested spans included.
+
+    With ``record=False`` spans are still timed but not kept, for
+    long-running processes that would otherwise collect them forever.
+    """
+
+    def __init__(self, record: bool = True):
+        self.record = record
+        self.spans: List[Dict] = []
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+        # Spans currently open in each thread, innermost last
+        self.open = threading.local()
+
+    @contextmanager
+    def span(self, name: str, **counts):
+        """Time the enclosed block; the yielded dict can receive more counts."""
+        stack = self.open.__dict__.setdefault('stack', [])
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # Resetting the peak would lose the enclosing spans' peaks, so
+            # fold it into them first
+            self._update_peaks(stack)
+            tracemalloc.reset_peak()
+
+        record = {
+            'name': name,
+            'thread': threading.get_ident(),
+            'counts': counts,
+            'peak_bytes': 0 if tracing else None,
+            'rss_start': _current_rss(),
+        }
+        stack.append(record)
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            end = time.perf_counter()
+            if tracing and tracemalloc.is_tracing():
+                self._update_peaks(stack)
+            stack.pop()
+            record.update(start=start - self.origin, seconds=end - start, rss_end=_current_rss())
+            if self.record:
+                with self.lock:
+                    self.spans.append(record)
+
+    @staticmethod
+    def _update_peaks(stack: List[Dict]):
+        peak = tracemalloc.get_traced_memory()[1]
+        for record in stack:
+            if record['peak_bytes'] is not None:
+                record['peak_bytes'] = max(record['peak_bytes'], peak)
+
+    def summary(self) -> str:
+        """Format the spans as a table for the results pane."""
+        lines = [f"{'Stage':<28}{'Time':>10}{'Peak traced':>13}{'RSS':>11}{'RSS change':>12}  Counts"]
+        for span in sorted(self.spans, key=lambda s: s['start']):
+            peak = _megabytes(span['peak_bytes'])
+            rss = _megabytes(span['rss_end'])
+            change = "-"
+            if span['rss_start'] is not None and span['rss_end'] is not None:
+                change = f"{(span['rss_end'] - span['rss_start']) / 1e6:+.1f} MB"
+            counts = ", ".join(f"{k}={v}" for k, v in span['counts'].items())
+            lines.append(f"{span['name']:<28}{span['seconds']:>9.3f}s{peak:>13}{rss:>11}{change:>12}  {counts}")
+        return "\n".join(lines)
+
+    def clear(self):
+        with self.lock:
+            self.spans = []
+
+    def write(self, path: str):
+        """Write the spans in Chrome trace event format (chrome://tracing, Perfetto)."""
+        events = [
+            {
+                'name': span['name'],
+                'ph': 'X',
+                'ts': span['start'] * 1e6,
+                'dur': span['seconds'] * 1e6,
+                'pid': os.getpid(),
+                'tid': span['thread'],
+                'args': dict(span['counts'], peak_bytes=span['peak_bytes'],
+                             rss_start=span['rss_start'], rss_end=span['rss_end']),
+            }
+            for span in self.spans
+        ]
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file, indent=1)
+
+
+# Spans are recorded on this tracer; callers that want a trace of a run
+# install a recording one with set_tracer(). The default keeps nothing, so
+# library use does not accumulate spans.
+_tracer = Tracer(record=False)
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def set_tracer(tracer: Tracer) -> Tracer:
+    global _tracer
+    _tracer = tracer
+    return tracer
+
+
+def span(name: str, **counts):
+    """Record a span on the current tracer; use as a context manager."""
+    return _tracer.span(name, **counts)
+
+
+@contextmanager
+def profiled(path: Optional[str]):
+    """Run the enclosed block under cProfile and dump the stats to ``path``.
+
+    Does nothing when ``path`` is None, so it can wrap code unconditionally.
+    """
+    if not path:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+@contextmanager
+def traced_memory(enabled: bool = True):
+    """Trace Python allocations with tracemalloc inside the block.
+
+    Spans then also report their peak traced memory. Tracing slows
+    allocation-heavy code down noticeably, so it is opt-in.
+    """
+    if not enabled or tracemalloc.is_tracing():
+        yield
+        return
+
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        tracemalloc.stop()
+
+
+def _current_rss() -> Optional[int]:
+    """Return the current resident set size in bytes, or None if unknown."""
+    try:
+        with open('/proc/self/statm', 'rb') as file:
+            return int(file.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _megabytes(value: Optional[int]) -> str:
+    return "-" if value is None else f"{value / 1e6:.1f} MB"
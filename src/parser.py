@@ -1,96 +1,533 @@
 """Parse WhatsApp chat export files."""
+import hashlib
+import io
+import multiprocessing
+import os
 import re
+import zipfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 from datetime import datetime
-from typing import List, Dict
+from functools import lru_cache
+from itertools import chain, islice
+from typing import BinaryIO, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from src.store import MessageStore
+
+
+# Bump whenever a change to the parser changes its output, so cached parse
+# results from older versions are no longer used.
+PARSER_VERSION = 2
+
+# Supported WhatsApp export formats, in detection order: the compiled line
+# pattern, the date field separator and the layout of the time field.
+FORMATS = [
+    # [DD/MM/YYYY, HH:MM:SS] Name: Message
+    (re.compile(r'^\[(\d{1,2}/\d{1,2}/\d{2,4}),\s(\d{1,2}:\d{2}:\d{2})\]\s([^:]+):\s(.+)$'),
+     '/', 'hms'),
+
+    # DD/MM/YYYY, H:MM am/pm - Name: Message
+    (re.compile(r'^(\d{1,2}/\d{1,2}/\d{2,4}),\s(\d{1,2}:\d{2}\s(?:am|pm))\s-\s([^:]+):\s(.+)$'),
+     '/', 'hm12'),
+
+    # DD/MM/YYYY, HH:MM - Name: Message
+    (re.compile(r'^(\d{1,2}/\d{1,2}/\d{2,4}),\s(\d{1,2}:\d{2})\s-\s([^:]+):\s(.+)$'),
+     '/', 'hm'),
+
+    # [DD.MM.YY, HH:MM:SS] Name: Message (German format)
+    (re.compile(r'^\[(\d{1,2}\.\d{1,2}\.\d{2,4}),\s(\d{1,2}:\d{2}:\d{2})\]\s([^:]+):\s(.+)$'),
+     '.', 'hms'),
+]
+
+# Number of non-empty lines inspected to detect the export format
+SNIFF_LINES = 50
+
+# Files are only split for parallel parsing into chunks at least this large
+MIN_CHUNK_BYTES = 32 * 1024 * 1024
+
+# Bytes read at a time while hashing
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Lines parsed between two calls of the progress callback
+PROGRESS_LINES = 10000
+
+# Seconds between two progress reports while waiting for worker processes
+POOL_POLL_SECONDS = 0.1
+
+# Name of the chat inside a zipped export
+ZIP_CHAT_NAME = '_chat.txt'
+
+# Decompressed bytes buffered at a time when reading a zipped export
+ZIP_BUFFER_SIZE = 1024 * 1024
+
+SYSTEM_MESSAGES = (
+    'end-to-end encrypted',
+    'changed their phone number',
+    'added you',
+    'created group',
+)
+
+
+@lru_cache(maxsize=8192)
+def _decode_date(date_str: str, sep: str):
+    """Decode a DD/MM/YYYY or DD/MM/YY date field, or return None if invalid.
+
+    Mirrors ``strptime`` with ``%d/%m/%Y`` falling back to ``%d/%m/%y``:
+    four-digit years are taken as-is, two-digit years map 69-99 to the
+    1900s and 00-68 to the 2000s.
+    """
+    day, month, year = date_str.split(sep)
+    if len(year) == 2:
+        year = int(year)
+        year += 1900 if year >= 69 else 2000
+    elif len(year) == 4:
+        year = int(year)
+    else:
+        return None
+
+    try:
+        datetime(year, int(month), int(day))
+    except ValueError:
+        return None
+    return year, int(month), int(day)
+
+
+@lru_cache(maxsize=4096)
+def _decode_time(time_str: str, layout: str):
+    """Decode an HH:MM[:SS] or H:MM am/pm time field, or return None if invalid."""
+    if layout == 'hm12':
+        clock, meridiem = time_str.split()
+        hour, minute = clock.split(':')
+        hour, minute, second = int(hour), int(minute), 0
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem == 'pm' else 0)
+    elif layout == 'hms':
+        hour, minute, second = map(int, time_str.split(':'))
+    else:
+        hour, minute = map(int, time_str.split(':'))
+        second = 0
+
+    if hour > 23 or minute > 59 or second > 59:
+        return None
+    return hour, minute, second
+
+
+def detect_format(lines: List[str]):
+    """Return the index in FORMATS matching most of ``lines``, or None."""
+    scores = [0] * len(FORMATS)
+    for line in lines:
+        for i, (pattern, _, _) in enumerate(FORMATS):
+            if pattern.match(line):
+                scores[i] += 1
+                break
+
+    best = max(range(len(FORMATS)), key=lambda i: scores[i])
+    return best if scores[best] else None
+
+
+def is_zip_export(file_path: str) -> bool:
+    return zipfile.is_zipfile(file_path)
+
+
+def _chat_member(archive: zipfile.ZipFile) -> zipfile.ZipInfo:
+    """Find the chat text in a zipped export: _chat.txt, or else its only .txt file."""
+    members = [info for info in archive.infolist() if not info.is_dir()]
+    for info in members:
+        if os.path.basename(info.filename) == ZIP_CHAT_NAME:
+            return info
+    texts = [info for info in members if info.filename.lower().endswith('.txt')]
+    if len(texts) == 1:
+        return texts[0]
+    raise ValueError(f"No chat text file found in {archive.filename}")
+
+
+def open_chat(file_path: str) -> BinaryIO:
+    """Open a chat export, either a text file or a .zip, for binary reading.
+
+    A zip is never extracted: the chat inside it is decompressed as it is
+    read, and offsets refer to the decompressed text.
+    """
+    if not is_zip_export(file_path):
+        return open(file_path, 'rb')
+    with zipfile.ZipFile(file_path) as archive:
+        # The member stays readable after the archive object is closed
+        return io.BufferedReader(archive.open(_chat_member(archive)), ZIP_BUFFER_SIZE)
+
+
+def chat_size(file_path: str) -> int:
+    """Return the size of the chat text in bytes, decompressed for a zip."""
+    if not is_zip_export(file_path):
+        return os.path.getsize(file_path)
+    with zipfile.ZipFile(file_path) as archive:
+        return _chat_member(archive).file_size
+
+
+class Checkpoint(NamedTuple):
+    """Where a parse of a chat file left off.
+
+    ``offset`` is the byte offset of the first line of the last message,
+    ``prefix_hash`` the hash of every byte before it, ``format`` the
+    detected export format and ``last_message`` the last message as parsed.
+    The last message is reparsed on resume, since a longer export may have
+    added continuation lines to it.
+    """
+    offset: int
+    prefix_hash: str
+    format: Optional[int]
+    last_message: Dict
+
+
+def _new_prefix_hash():
+    return hashlib.blake2b(digest_size=16)
+
+
+def _hash_prefix(file: BinaryIO, length: int):
+    """Hash the first ``length`` bytes of an open file, or None if it is shorter."""
+    file.seek(0)
+    prefix_hash = _new_prefix_hash()
+    while length:
+        block = file.read(min(length, HASH_BLOCK_SIZE))
+        if not block:
+            return None
+        prefix_hash.update(block)
+        length -= len(block)
+    return prefix_hash
+
+
+class Cancelled(Exception):
+    """Raised by a progress callback to abort parsing."""
+
+
+class PoolProgress:
+    """Bytes parsed and a cancel flag shared with the workers of a process pool.
+
+    Workers started by executor() add the bytes they parse to ``parsed``
+    as they go (see worker_progress()) and raise Cancelled at their next
+    progress report once ``cancelled`` is set.
+    """
+
+    def __init__(self):
+        context = multiprocessing.get_context()
+        self.parsed = context.Value('q', 0)
+        self.cancelled = context.Event()
+
+    def executor(self, workers: int) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self,))
+
+    def gather(self, executor: ProcessPoolExecutor, futures: Dict[Future, int],
+               progress: Optional[Callable[[int], None]]) -> list:
+        """Return the results of ``futures``, ordered by the position each maps to.
+
+        ``progress`` is called with the bytes parsed by all workers every
+        POOL_POLL_SECONDS. If it or a worker raises, the running workers are
+        told to stop and waited for before the exception propagates.
+        """
+        results = [None] * len(futures)
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=POOL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[futures[future]] = future.result()
+                if progress:
+                    progress(self.parsed.value)
+        except BaseException:
+            self.cancelled.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        return results
+
+
+# The PoolProgress of the pool this worker process belongs to, if any
+_pool_progress: Optional[PoolProgress] = None
+
+
+def _init_worker(shared: PoolProgress):
+    global _pool_progress
+    _pool_progress = shared
+
+
+def worker_progress(start: int = 0) -> Optional[Callable[[int], None]]:
+    """Return a progress callback adding a worker's bytes to its pool's count.
+
+    The callback takes byte offsets, like WhatsAppParser's, counted from
+    ``start``. Returns None outside a PoolProgress pool.
+    """
+    shared = _pool_progress
+    if shared is None:
+        return None
+    last = start
+
+    def report(offset: int):
+        nonlocal last
+        if shared.cancelled.is_set():
+            raise Cancelled()
+        with shared.parsed.get_lock():
+            shared.parsed.value += offset - last
+        last = offset
+    return report
+
+
+def _parse_range(file_path: str, format: Optional[int], start: int, end: int):
+    """Parse the messages starting in one byte range of a file (worker process).
+
+    Returns the messages as a MessageStore and the offset of the last
+    message's first line, or None if the range holds no message.
+    """
+    parser = WhatsAppParser(file_path, worker_progress(start))
+    with open_chat(file_path) as file:
+        store = MessageStore.from_messages(parser._iter_from(file, start, None, format, end))
+    return store, parser.last_offset
 
 
 class WhatsAppParser:
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, progress: Optional[Callable[[int], None]] = None):
         self.file_path = file_path
+        # Called with the number of bytes of the file parsed so far. An
+        # exception raised by it aborts the parse, which is how it is cancelled.
+        self.progress = progress
         self.messages = []
-    
+        # Index into FORMATS, detected once from the head of the file
+        self.format: Optional[int] = None
+        # Set once the file has been parsed to the end
+        self.checkpoint: Optional[Checkpoint] = None
+        # Offset of the first line of the last message parsed
+        self.last_offset: Optional[int] = None
+
     def parse(self) -> List[Dict]:
         """Parse WhatsApp chat file and return list of messages."""
-        with open(self.file_path, 'r', encoding='utf-8') as file:
-            lines = file.readlines()
-        
-        # Multiple WhatsApp format patterns to try
-        patterns = [
-            # [DD/MM/YYYY, HH:MM:SS] Name: Message
-            (r'^\[(\d{1,2}/\d{1,2}/\d{2,4}),\s(\d{1,2}:\d{2}:\d{2})\]\s([^:]+):\s(.+)$', 
-             [("%d/%m/%Y", "%H:%M:%S"), ("%d/%m/%y", "%H:%M:%S")]),
-            
-            # DD/MM/YYYY, H:MM am/pm - Name: Message
-            (r'^(\d{1,2}/\d{1,2}/\d{2,4}),\s(\d{1,2}:\d{2}\s(?:am|pm))\s-\s([^:]+):\s(.+)$',
-             [("%d/%m/%Y", "%I:%M %p"), ("%d/%m/%y", "%I:%M %p")]),
-            
-            # DD/MM/YYYY, HH:MM - Name: Message
-            (r'^(\d{1,2}/\d{1,2}/\d{2,4}),\s(\d{1,2}:\d{2})\s-\s([^:]+):\s(.+)$',
-             [("%d/%m/%Y", "%H:%M"), ("%d/%m/%y", "%H:%M")]),
-            
-            # [DD.MM.YY, HH:MM:SS] Name: Message (German format)
-            (r'^\[(\d{1,2}\.\d{1,2}\.\d{2,4}),\s(\d{1,2}:\d{2}:\d{2})\]\s([^:]+):\s(.+)$',
-             [("%d.%m.%Y", "%H:%M:%S"), ("%d.%m.%y", "%H:%M:%S")]),
-        ]
-        
+        self.messages = list(self.iter_messages())
+        return self.messages
+
+    def iter_messages(self) -> Iterator[Dict]:
+        """Read the chat file line by line and yield messages one at a time.
+
+        Only the message currently being assembled is buffered, so memory
+        use does not grow with the size of the file.
+        """
+        with open_chat(self.file_path) as file:
+            yield from self._iter_from(file, 0, _new_prefix_hash(), None)
+
+    def parse_store(self, workers: int = 1) -> MessageStore:
+        """Parse the whole file into a MessageStore, using up to ``workers`` processes.
+
+        Large files are split into byte ranges that each begin on a message
+        line (see split_ranges), parsed in separate processes and joined in
+        order. The result is identical to parsing the file serially. Zipped
+        exports are always parsed serially, since a compressed stream cannot
+        be entered in the middle.
+        """
+        size = os.path.getsize(self.file_path)
+        chunks = 1 if is_zip_export(self.file_path) else min(workers, size // MIN_CHUNK_BYTES)
+        if chunks < 2:
+            return MessageStore.from_messages(self.iter_messages())
+
+        ranges = self.split_ranges(chunks)
+        shared = PoolProgress()
+        with shared.executor(len(ranges)) as executor:
+            futures = {executor.submit(_parse_range, self.file_path, self.format, start, end): i
+                       for i, (start, end) in enumerate(ranges)}
+            results = shared.gather(executor, futures, self.progress)
+
+        store = MessageStore.concat([chunk for chunk, _ in results])
+
+        # The checkpoint covers the whole file, as after a serial parse
+        self.checkpoint = None
+        last_offsets = [offset for chunk, offset in results if len(chunk)]
+        if last_offsets:
+            self.last_offset = last_offsets[-1]
+            with open_chat(self.file_path) as file:
+                prefix_hash = _hash_prefix(file, self.last_offset)
+            self.checkpoint = Checkpoint(self.last_offset, prefix_hash.hexdigest(),
+                                         self.format, store[len(store) - 1])
+        return store
+
+    def split_ranges(self, chunks: int) -> List[Tuple[int, int]]:
+        """Split the file into at most ``chunks`` byte ranges for parallel parsing.
+
+        Each boundary is moved forward to the next line that starts a message,
+        so continuation lines always stay in the same range as their message
+        and every range can be parsed on its own. Also detects self.format.
+        """
+        size = os.path.getsize(self.file_path)
+
+        with open(self.file_path, 'rb') as file:
+            lines = self._read_lines(file, 0, None)
+            self.format = detect_format([line for _, line in islice(lines, SNIFF_LINES)])
+            formats = self._format_order()
+
+            boundaries = [0]
+            for i in range(1, chunks):
+                start = max(size * i // chunks, boundaries[-1])
+                file.seek(start)
+                # Skip the rest of the line the guess landed in
+                start += len(file.readline())
+
+                boundary = size
+                for line_offset, line in self._read_lines(file, start, None):
+                    if self._match_line(line, formats)[1]:
+                        boundary = line_offset
+                        break
+
+                if boundary > boundaries[-1]:
+                    boundaries.append(boundary)
+            boundaries.append(size)
+
+        return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+    def parse_tail(self, checkpoint: Checkpoint) -> Optional[List[Dict]]:
+        """Parse only what was appended to the file since ``checkpoint``.
+
+        Returns the messages from the checkpoint's last message onwards (the
+        first one replaces ``checkpoint.last_message``, possibly with more
+        continuation lines), or None if the file no longer starts with the
+        content the checkpoint was taken from.
+        """
+        with open_chat(self.file_path) as file:
+            prefix_hash = _hash_prefix(file, checkpoint.offset)
+            if prefix_hash is None or prefix_hash.hexdigest() != checkpoint.prefix_hash:
+                return None
+
+            tail = list(self._iter_from(file, checkpoint.offset, prefix_hash, checkpoint.format))
+
+        last = checkpoint.last_message
+        if not tail or tail[0]['datetime'] != last['datetime'] or \
+           tail[0]['sender'] != last['sender'] or \
+           not tail[0]['message'].startswith(last['message']):
+            return None
+
+        self.messages = tail
+        return tail
+
+    def _iter_from(self, file: BinaryIO, offset: int, prefix_hash, format: Optional[int],
+                   end: Optional[int] = None) -> Iterator[Dict]:
+        """Yield messages from the lines starting in ``offset`` to ``end``.
+
+        ``prefix_hash`` must already cover every byte before ``offset``; it
+        is advanced up to the start of the last message to build
+        self.checkpoint. Pass None to skip hashing. The format is sniffed
+        if ``format`` is None, and ``end`` defaults to the end of the file.
+        """
         current_message = None
-        
-        for line in lines:
-            line = line.rstrip('\n')
-            
+        current_offset = offset
+        continuation = []
+        # (offset, raw line) read since the start of the current message, not hashed yet
+        pending = deque() if prefix_hash is not None else None
+
+        file.seek(offset)
+        lines = self._read_lines(file, offset, pending, end)
+
+        if format is None:
+            head = list(islice(lines, SNIFF_LINES))
+            format = detect_format([line for _, line in head])
+            lines = chain(head, lines)
+        self.format = format
+        formats = self._format_order()
+
+        for line_number, (line_offset, line) in enumerate(lines):
+            if self.progress and not line_number % PROGRESS_LINES:
+                self.progress(line_offset)
+
+            matched, message = self._match_line(line, formats)
+
+            if message:
+                # Emit the previous message once all its lines are known
+                if current_message:
+                    yield self._finish(current_message, continuation)
+                current_message = message
+                current_offset = line_offset
+                continuation = []
+
+                # Everything before this line now belongs to the prefix
+                while pending and pending[0][0] < line_offset:
+                    prefix_hash.update(pending.popleft()[1])
+            elif not matched and current_message:
+                # If line didn't match any pattern, it's a continuation of previous message
+                continuation.append(line)
+
+        # Don't forget the last message
+        if current_message:
+            last_message = self._finish(current_message, continuation)
+            self.last_offset = current_offset
+            if prefix_hash is not None:
+                self.checkpoint = Checkpoint(current_offset, prefix_hash.hexdigest(),
+                                             self.format, dict(last_message))
+            yield last_message
+
+        if self.progress:
+            self.progress(file.tell() if end is None else end)
+
+    @staticmethod
+    def _read_lines(file: BinaryIO, offset: int, pending: Optional[deque],
+                    end: Optional[int] = None) -> Iterator[tuple]:
+        """Yield ``(offset, line)`` for each non-empty line, decoded.
+
+        Reading stops at the first line starting at or after ``end``. Every
+        raw line, including empty ones, is also appended to ``pending``
+        (if given) so the caller can hash the bytes it has consumed.
+        """
+        for raw in file:
+            if end is not None and offset >= end:
+                break
+            if pending is not None:
+                pending.append((offset, raw))
+            line_offset = offset
+            offset += len(raw)
+
+            line = raw.decode('utf-8').rstrip('\r\n')
+
             # Skip empty lines
             if not line.strip():
                 continue
-            
-            matched = False
-            
-            # Try each pattern
-            for pattern, date_formats in patterns:
-                match = re.match(pattern, line)
-                
-                if match:
-                    date_str, time_str, sender, message = match.groups()
-                    
-                    # Skip system messages
-                    if 'end-to-end encrypted' in message.lower() or \
-                       'changed their phone number' in message.lower() or \
-                       'added you' in message.lower() or \
-                       'created group' in message.lower():
-                        matched = True
-                        break
-                    
-                    # Try to parse datetime
-                    parsed = False
-                    for date_fmt, time_fmt in date_formats:
-                        try:
-                            dt = datetime.strptime(f"{date_str} {time_str}", f"{date_fmt} {time_fmt}")
-                            parsed = True
-                            
-                            # Save previous message if exists
-                            if current_message:
-                                self.messages.append(current_message)
-                            
-                            # Start new message
-                            current_message = {
-                                'datetime': dt,
-                                'sender': sender.strip(),
-                                'message': message.strip()
-                            }
-                            
-                            matched = True
-                            break
-                        except ValueError:
-                            continue
-                    
-                    if matched:
-                        break
-            
-            # If line didn't match any pattern, it's a continuation of previous message
-            if not matched and current_message:
-                current_message['message'] += '\n' + line
-        
-        # Don't forget the last message
-        if current_message:
-            self.messages.append(current_message)
-        
-        return self.messages
\ No newline at end of file
+
+            yield line_offset, line
+
+    def _format_order(self) -> List[tuple]:
+        """Return FORMATS with the detected format moved to the front.
+
+        Lines in the detected format are decided by a single regex match;
+        the remaining formats are only tried for lines it rejects, which
+        are mostly continuation lines.
+        """
+        if self.format is None:
+            return FORMATS
+        return [FORMATS[self.format]] + [fmt for i, fmt in enumerate(FORMATS) if i != self.format]
+
+    @staticmethod
+    def _finish(message: Dict, continuation: List[str]) -> Dict:
+        if continuation:
+            message['message'] = '\n'.join([message['message']] + continuation)
+        return message
+
+    @staticmethod
+    def _match_line(line: str, formats: List[tuple] = FORMATS):
+        """Match a line against the known formats.
+
+        Returns ``(matched, message)``: ``matched`` is True when the line is a
+        message header (including skipped system messages), ``message`` is the
+        new message dict or None.
+        """
+        for pattern, sep, layout in formats:
+            match = pattern.match(line)
+
+            if match:
+                date_str, time_str, sender, message = match.groups()
+
+                # Skip system messages
+                message_lower = message.lower()
+                if any(system in message_lower for system in SYSTEM_MESSAGES):
+                    return True, None
+
+                date = _decode_date(date_str, sep)
+                time = _decode_time(time_str, layout)
+                if date is None or time is None:
+                    continue
+
+                return True, {
+                    'datetime': datetime(*date, *time),
+                    'sender': sender.strip(),
+                    'message': message.strip()
+                }
+
+        return False, None
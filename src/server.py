@@ -0,0 +1,226 @@
+"""Local HTTP server that keeps parsed chats in memory and answers queries.
+
+Endpoints (all GET, JSON unless noted):
+
+- ``/status``: the loaded files, message count and result cache statistics
+- ``/count?phrase=lol&phrase=hello&case_sensitive=1``: the same per-phrase
+  aggregates as ``python -m src analyze``; phrases may also be comma-separated
+- ``/chart?phrase=lol&view=monthly&format=png&preview=1``: a rendered chart
+  (image/png or image/svg+xml)
+- ``/reload``: reread the files, e.g. after a chat was exported again; when
+  an export only grew, just its new messages are counted for cached results
+"""
+import asyncio
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from src.analyzer import ChatAnalyzer
+from src.cli import analysis_to_dict, split_phrases
+from src.ingest import load_analyzer
+from src.store import MessageStore
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Largest request head accepted, in bytes
+MAX_REQUEST_BYTES = 64 * 1024
+
+# Largest chart resolution rendered, so one request cannot tie up a
+# renderer with a huge image
+MAX_DPI = 600
+
+CONTENT_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class QueryServer:
+    """Answers phrase queries against one corpus loaded at startup.
+
+    Queries run in a thread pool so the event loop stays free to accept
+    more clients. A message store is never modified, so queries count
+    concurrently; the analyzer only locks its result cache, which every
+    client shares, and reload() swaps in a new store under that lock.
+    Charts are rendered in worker processes.
+    """
+
+    def __init__(self, messages: MessageStore, files: List[str], duplicate_count: int = 0,
+                 threads: Optional[int] = None, render_workers: Optional[int] = None,
+                 cache_dir: Optional[str] = None):
+        self.analyzer = ChatAnalyzer(messages)
+        self.files = files
+        self.duplicate_count = duplicate_count
+        self.cache_dir = cache_dir
+        # Case sensitivities indexed with build_index(), rebuilt after a reload
+        self.indexed = set()
+        self.reload_lock = threading.Lock()
+        self.threads = ThreadPoolExecutor(max_workers=threads)
+        self.render_workers = render_workers
+        # Created on the first chart request, so matplotlib is only loaded then
+        self.renderer: Optional[ProcessPoolExecutor] = None
+
+    def build_index(self, case_sensitive: bool = False):
+        self.analyzer.build_index(case_sensitive)
+        self.indexed.add(case_sensitive)
+
+    def reload(self) -> Dict:
+        with self.reload_lock:
+            analyzer, duplicate_count = load_analyzer(self.files, self.analyzer, self.cache_dir,
+                                                      self.render_workers)
+            for case_sensitive in self.indexed:
+                analyzer.build_index(case_sensitive)
+            self.analyzer, self.duplicate_count = analyzer, duplicate_count
+        return self.status()
+
+    def count(self, phrases: List[str], case_sensitive: bool) -> List[Dict]:
+        return self.analyzer.count_phrases(phrases, case_sensitive)
+
+    def report(self, phrases: List[str], case_sensitive: bool) -> Dict:
+        # Rollups of the cubes are computed here too, off the event loop
+        return {
+            'case_sensitive': case_sensitive,
+            'phrases': [analysis_to_dict(analysis) for analysis in self.count(phrases, case_sensitive)],
+        }
+
+    def status(self) -> Dict:
+        return {
+            'files': self.files,
+            'messages': len(self.analyzer.messages),
+            'duplicates_removed': self.duplicate_count,
+            'cache': self.analyzer.cache_info(),
+        }
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_REQUEST_BYTES)
+        addresses = ", ".join(f"http://{sock.getsockname()[0]}:{sock.getsockname()[1]}"
+                              for sock in server.sockets)
+        print(f"Serving {len(self.analyzer.messages)} messages on {addresses}", flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        self.threads.shutdown(wait=False, cancel_futures=True)
+        if self.renderer:
+            self.renderer.shutdown(wait=False, cancel_futures=True)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answer one request per connection."""
+        try:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+                method, target = self.parse_request(head)
+                status, content_type, body = await self.dispatch(method, target)
+            except HTTPError as e:
+                status, content_type, body = e.status, 'application/json', _json({'error': str(e)})
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                status, content_type, body = 400, 'application/json', _json({'error': "Malformed request"})
+            except Exception as e:
+                status, content_type, body = 500, 'application/json', _json({'error': str(e)})
+
+            writer.write(
+                f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode('latin-1') + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def parse_request(head: bytes) -> Tuple[str, str]:
+        request_line = head.split(b'\r\n', 1)[0].decode('latin-1')
+        parts = request_line.split()
+        if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+            raise HTTPError(400, "Malformed request line")
+        return parts[0], parts[1]
+
+    async def dispatch(self, method: str, target: str) -> Tuple[int, str, bytes]:
+        if method != 'GET':
+            raise HTTPError(405, "Only GET is supported")
+
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        loop = asyncio.get_running_loop()
+
+        if url.path == '/status':
+            result = await loop.run_in_executor(self.threads, self.status)
+            return 200, 'application/json', _json(result)
+
+        if url.path == '/reload':
+            result = await loop.run_in_executor(self.threads, self.reload)
+            return 200, 'application/json', _json(result)
+
+        if url.path == '/count':
+            phrases = split_phrases(query.get('phrase', []))
+            if not phrases:
+                raise HTTPError(400, "No valid phrases given")
+            result = await loop.run_in_executor(
+                self.threads, self.report, phrases, _flag(query, 'case_sensitive'))
+            return 200, 'application/json', _json(result)
+
+        if url.path == '/chart':
+            return await self.chart(query)
+
+        raise HTTPError(404, f"Unknown path: {url.path}")
+
+    async def chart(self, query: Dict[str, List[str]]) -> Tuple[int, str, bytes]:
+        # matplotlib is only needed once a chart is requested
+        from src.visualizer import DEFAULT_DPI, FORMATS, PREVIEW_DPI, VIEWS, chart_filename, render_view
+
+        phrase = query.get('phrase', [''])[0].strip()
+        view = query.get('view', ['monthly'])[0]
+        fmt = query.get('format', ['png'])[0]
+        preview = _flag(query, 'preview')
+        if not phrase:
+            raise HTTPError(400, "No phrase given")
+        if view not in VIEWS:
+            raise HTTPError(400, f"Unknown view: {view}")
+        if fmt not in FORMATS:
+            raise HTTPError(400, f"Unsupported chart format: {fmt}")
+        try:
+            dpi = int(query.get('dpi', [DEFAULT_DPI])[0])
+        except ValueError:
+            raise HTTPError(400, "dpi must be a number")
+        if not 1 <= dpi <= MAX_DPI:
+            raise HTTPError(400, f"dpi must be between 1 and {MAX_DPI}")
+
+        loop = asyncio.get_running_loop()
+        analysis = (await loop.run_in_executor(
+            self.threads, self.count, [phrase], _flag(query, 'case_sensitive')))[0]
+
+        if self.renderer is None:
+            self.renderer = ProcessPoolExecutor(max_workers=self.render_workers)
+        with tempfile.TemporaryDirectory() as output_dir:
+            path = os.path.join(output_dir, f"{chart_filename(phrase)}_{view}.{fmt}")
+            saved = await loop.run_in_executor(self.renderer, render_view, analysis, view, path,
+                                               PREVIEW_DPI if preview else dpi, fmt, preview)
+            if not saved:
+                raise HTTPError(404, f"No data to plot for '{phrase}'")
+            with open(path, 'rb') as file:
+                return 200, CONTENT_TYPES[fmt], file.read()
+
+
+def _json(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def _flag(query: Dict[str, List[str]], name: str) -> bool:
+    return query.get(name, ['0'])[0].lower() in ('1', 'true', 'yes')
@@ -0,0 +1,283 @@
+"""Columnar in-memory storage for parsed WhatsApp messages."""
+import hashlib
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.instrumentation import span
+
+
+EPOCH = datetime(1970, 1, 1)
+SECOND = timedelta(seconds=1)
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Terminates every message in the text buffer, so a search over the whole
+# buffer can never match across two messages.
+SEPARATOR = b'\x00'
+
+
+def to_epoch(dt: datetime) -> int:
+    """Convert a naive datetime to whole seconds since 1970-01-01."""
+    return (dt - EPOCH) // SECOND
+
+
+def from_epoch(seconds: int) -> datetime:
+    """Convert seconds since 1970-01-01 back to a naive datetime."""
+    return EPOCH + timedelta(seconds=int(seconds))
+
+
+def message_fingerprint(sender: bytes, message: bytes) -> int:
+    """Hash a sender and message body (both encoded) to a 64-bit integer."""
+    return int.from_bytes(hashlib.blake2b(sender + message, digest_size=8).digest(), 'little')
+
+
+class MessageStore:
+    """Parsed messages kept as columns instead of one dict per message.
+
+    - ``timestamps``: int64 seconds since the epoch, one per message
+    - ``sender_codes``: int32 index into ``senders``, one per message
+    - ``senders``: each distinct sender name, stored once
+    - ``text``: UTF-8 message bodies, each terminated by SEPARATOR
+    - ``offsets``: int64 start of each message in ``text``, plus the end
+      of the buffer, so message ``i`` is ``text[offsets[i]:offsets[i + 1] - 1]``
+
+    Iterating a store or indexing it yields the usual message dicts, so it
+    can stand in for the list returned by WhatsAppParser.parse().
+
+    Stores are never modified in place, so the case-folded copy of the text
+    used by case-insensitive search is built on first use and kept.
+    """
+
+    def __init__(self, timestamps: np.ndarray, sender_codes: np.ndarray,
+                 senders: List[str], text: bytes, offsets: np.ndarray):
+        self.timestamps = timestamps
+        self.sender_codes = sender_codes
+        self.senders = senders
+        self.text = text
+        self.offsets = offsets
+        # (text, offsets) of the case-folded text, built by folded()
+        self._folded: Optional[Tuple[bytes, np.ndarray]] = None
+
+    @classmethod
+    def from_messages(cls, messages: Iterable[Dict]) -> 'MessageStore':
+        """Build a store from message dicts, consuming the iterable once."""
+        timestamps = array('q')
+        sender_codes = array('i')
+        lengths = array('q')
+        senders = []
+        sender_index = {}
+        parts = []
+
+        for msg in messages:
+            sender = msg['sender']
+            code = sender_index.get(sender)
+            if code is None:
+                code = sender_index[sender] = len(senders)
+                senders.append(sender)
+
+            body = msg['message'].encode('utf-8') + SEPARATOR
+            timestamps.append(to_epoch(msg['datetime']))
+            sender_codes.append(code)
+            lengths.append(len(body))
+            parts.append(body)
+
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(np.frombuffer(lengths, dtype=np.int64), out=offsets[1:])
+
+        return cls(
+            np.frombuffer(timestamps, dtype=np.int64).copy(),
+            np.frombuffer(sender_codes, dtype=np.int32).copy(),
+            senders,
+            b''.join(parts),
+            offsets,
+        )
+
+    @classmethod
+    def concat(cls, stores: List['MessageStore']) -> 'MessageStore':
+        """Join stores end to end, merging their sender lists."""
+        senders, remaps = _merge_senders(stores)
+        codes = []
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+
+        for store, remap in zip(stores, remaps):
+            codes.append(remap[store.sender_codes])
+            offsets.append(store.offsets[1:] + base)
+            base += len(store.text)
+
+        return cls(
+            np.concatenate([store.timestamps for store in stores] or [np.zeros(0, dtype=np.int64)]),
+            np.concatenate(codes or [np.zeros(0, dtype=np.int32)]),
+            senders,
+            b''.join(store.text for store in stores),
+            np.concatenate(offsets),
+        )
+
+    @classmethod
+    def gather(cls, stores: List['MessageStore'], sources: np.ndarray, rows: np.ndarray) -> 'MessageStore':
+        """Build a store from rows of several stores, without joining them first.
+
+        Message ``i`` is row ``rows[i]`` of ``stores[sources[i]]``. Text is
+        copied in runs of consecutive rows of one store, so stores that
+        follow each other in time are copied in a few large pieces.
+        """
+        senders, remaps = _merge_senders(stores)
+        count = len(rows)
+        timestamps = np.empty(count, dtype=np.int64)
+        codes = np.empty(count, dtype=np.int32)
+        starts = np.empty(count, dtype=np.int64)
+        lengths = np.empty(count, dtype=np.int64)
+        for source, (store, remap) in enumerate(zip(stores, remaps)):
+            mine = sources == source
+            picked = rows[mine]
+            timestamps[mine] = store.timestamps[picked]
+            codes[mine] = remap[store.sender_codes[picked]]
+            starts[mine] = store.offsets[picked]
+            lengths[mine] = store.offsets[picked + 1] - starts[mine]
+        offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        runs = np.flatnonzero(np.concatenate(([True], (np.diff(sources) != 0) | (np.diff(rows) != 1))))
+        runs = runs[:count]
+        run_lengths = offsets[np.append(runs, count)[1:]] - offsets[runs]
+        texts = [store.text for store in stores]
+        text = b''.join([texts[source][start:start + length] for source, start, length in zip(
+            sources[runs].tolist(), starts[runs].tolist(), run_lengths.tolist())])
+        return cls(timestamps, codes, senders, text, offsets)
+
+    def slice(self, start: int, stop: int) -> 'MessageStore':
+        """Return a new store holding messages ``start`` to ``stop - 1``."""
+        text_start, text_stop = int(self.offsets[start]), int(self.offsets[stop])
+        return MessageStore(
+            self.timestamps[start:stop].copy(),
+            self.sender_codes[start:stop].copy(),
+            list(self.senders),
+            self.text[text_start:text_stop],
+            self.offsets[start:stop + 1] - text_start,
+        )
+
+    def take(self, indices: np.ndarray) -> 'MessageStore':
+        """Return a new store holding the messages at ``indices``, in that order."""
+        starts = self.offsets[indices].tolist()
+        ends = self.offsets[indices + 1].tolist()
+        text = b''.join([self.text[start:end] for start, end in zip(starts, ends)])
+        lengths = np.asarray(ends, dtype=np.int64) - np.asarray(starts, dtype=np.int64)
+        return MessageStore(
+            self.timestamps[indices],
+            self.sender_codes[indices],
+            list(self.senders),
+            text,
+            np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+        )
+
+    def shares_prefix(self, other: 'MessageStore', count: int) -> bool:
+        """Whether the first ``count`` messages of this store and ``other`` are the same."""
+        if count > len(self) or count > len(other):
+            return False
+        if not (np.array_equal(self.timestamps[:count], other.timestamps[:count])
+                and np.array_equal(self.offsets[:count + 1], other.offsets[:count + 1])):
+            return False
+
+        # Sender codes may differ between stores, so compare by name
+        other_index = {sender: code for code, sender in enumerate(other.senders)}
+        remap = np.array([other_index.get(sender, -1) for sender in self.senders] or [-1], dtype=np.int32)
+        if not np.array_equal(remap[self.sender_codes[:count]], other.sender_codes[:count]):
+            return False
+        # Compares in place, without copying either text
+        return self.text.startswith(memoryview(other.text)[:int(other.offsets[count])])
+
+    def fingerprints(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Return a 64-bit hash of the sender and text of each message, or of ``rows``.
+
+        Two messages with the same timestamp and fingerprint are treated as
+        the same message, without keeping their text around to compare.
+        """
+        senders = [sender.encode('utf-8') + SEPARATOR for sender in self.senders]
+        codes = self.sender_codes.tolist()
+        offsets = self.offsets.tolist()
+        text = self.text
+        rows = range(len(codes)) if rows is None else rows.tolist()
+        return np.fromiter(
+            (message_fingerprint(senders[codes[i]], text[offsets[i]:offsets[i + 1]]) for i in rows),
+            dtype=np.uint64, count=len(rows))
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Return the columns as named arrays, e.g. for np.savez."""
+        return {
+            'timestamps': self.timestamps,
+            'sender_codes': self.sender_codes,
+            'senders': np.array(self.senders, dtype=str),
+            'text': np.frombuffer(self.text, dtype=np.uint8),
+            'offsets': self.offsets,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays) -> 'MessageStore':
+        """Rebuild a store from the arrays returned by to_arrays()."""
+        return cls(
+            arrays['timestamps'],
+            arrays['sender_codes'],
+            arrays['senders'].tolist(),
+            arrays['text'].tobytes(),
+            arrays['offsets'],
+        )
+
+    def folded(self) -> Tuple[bytes, np.ndarray]:
+        """Return the case-folded text buffer and the offsets of its messages.
+
+        Built once, the first time it is needed. casefold() is used rather
+        than lower() so that e.g. 'Straße' and 'STRASSE' match.
+        """
+        if self._folded is None:
+            with span('casefold text', messages=len(self)):
+                text = self.text.decode('utf-8').casefold().encode('utf-8')
+                if len(text) == len(self.text):
+                    offsets = self.offsets
+                else:
+                    # Folding changed the byte length of some messages, so the
+                    # boundaries are recovered from the separators instead
+                    ends = np.flatnonzero(np.frombuffer(text, dtype=np.uint8) == SEPARATOR[0]) + 1
+                    offsets = np.concatenate(([0], ends))
+            self._folded = (text, offsets)
+        return self._folded
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i: int) -> Dict:
+        return {
+            'datetime': self.datetime_at(i),
+            'sender': self.sender_at(i),
+            'message': self.message_at(i),
+        }
+
+    def datetime_at(self, i: int) -> datetime:
+        return from_epoch(self.timestamps[i])
+
+    def sender_at(self, i: int) -> str:
+        return self.senders[self.sender_codes[i]]
+
+    def message_at(self, i: int) -> str:
+        return self.text[self.offsets[i]:self.offsets[i + 1] - 1].decode('utf-8')
+
+
+def _merge_senders(stores: List[MessageStore]) -> Tuple[List[str], List[np.ndarray]]:
+    """Return the senders of all stores and, per store, its codes translated into them."""
+    senders = []
+    sender_index = {}
+    remaps = []
+    for store in stores:
+        remap = np.empty(len(store.senders), dtype=np.int32)
+        for code, sender in enumerate(store.senders):
+            if sender not in sender_index:
+                sender_index[sender] = len(senders)
+                senders.append(sender)
+            remap[code] = sender_index[sender]
+        remaps.append(remap)
+    return senders, remaps
@@ -1,129 +1,371 @@
 """Create visualizations from analyzed data."""
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
 import matplotlib
+import numpy as np
 matplotlib.use('Agg')  # Use non-GUI backend for threading
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from datetime import datetime
-from typing import Dict, List
-from collections import Counter, defaultdict
+from matplotlib.figure import Figure
+
+from src.instrumentation import span
+
+
+DEFAULT_DPI = 300
+# Resolution used by the fast preview mode
+PREVIEW_DPI = 72
+
+FORMATS = ('png', 'svg')
+
+# Charts rendered per phrase; the cube-based views are opt-in
+VIEWS = ('monthly', 'timeline', 'weekly', 'hourly', 'senders')
+DEFAULT_VIEWS = ('monthly', 'timeline')
+
+# Smallest horizontal space, in output pixels, given to one timeline bin
+TIMELINE_PIXELS_PER_BIN = 3
+# Bin widths in days a dense timeline can be aggregated to
+BIN_DAYS = (1, 2, 7, 14, 28, 91, 182, 364)
+BIN_NAMES = {1: 'Day', 7: 'Week', 14: 'Fortnight', 364: 'Year'}
+
+
+def chart_filename(phrase: str) -> str:
+    """Turn a phrase into a string that is safe to use in a file name."""
+    return "".join(c if c.isalnum() else "_" for c in phrase)
+
+
+def timeline_bins(days: np.ndarray, counts: np.ndarray, max_bins: int):
+    """Sum daily counts into at most ``max_bins`` bins of equal width.
+
+    ``days`` (datetime64[D]) must be sorted. The width is the smallest of
+    BIN_DAYS that fits the date span into ``max_bins``. Returns the first
+    day of each bin, the counts per bin (empty bins included) and the
+    width in days.
+    """
+    day_numbers = days.astype(np.int64)
+    first = day_numbers[0]
+    span = int(day_numbers[-1] - first) + 1
+    width = next((w for w in BIN_DAYS if span <= w * max_bins), -(-span // max_bins))
+
+    totals = np.bincount((day_numbers - first) // width, weights=counts).astype(np.int64)
+    starts = (first + width * np.arange(len(totals))).astype('datetime64[D]')
+    return starts, totals, width
 
 
 class ChatVisualizer:
-    def __init__(self, analysis: Dict):
+    """Charts of one phrase's analysis.
+
+    Each plot_* method saves its chart to ``output_path`` (or shows it if
+    no path is given) and returns whether there was anything to plot.
+    """
+
+    def __init__(self, analysis: Dict, dpi: int = DEFAULT_DPI, fmt: str = 'png', preview: bool = False):
+        # preview trades quality for speed: low resolution, no tight bounding box
         self.analysis = analysis
-    
-    def plot_monthly_usage(self, output_path: str = None):
+        self.dpi = PREVIEW_DPI if preview else dpi
+        self.fmt = fmt
+        self.preview = preview
+
+    def plot_monthly_usage(self, output_path: str = None) -> bool:
         """Create a bar chart showing monthly usage of the phrase."""
         monthly_counts = self.analysis['monthly_counts']
-        
+
         if not monthly_counts:
-            print("No data to plot.")
-            return
-        
+            print("No data to plot.", file=sys.stderr)
+            return False
+
         months = list(monthly_counts.keys())
         counts = list(monthly_counts.values())
-        
-        plt.figure(figsize=(12, 6))
-        plt.bar(months, counts, color='#25D366', edgecolor='black', alpha=0.7)
-        
-        plt.xlabel('Month', fontsize=12)
-        plt.ylabel('Number of Times Said', fontsize=12)
-        plt.title(f"Monthly Usage of '{self.analysis['phrase']}'", fontsize=14, fontweight='bold')
-        plt.xticks(rotation=45, ha='right')
-        plt.grid(axis='y', alpha=0.3)
-        plt.tight_layout()
-        
-        if output_path:
-            plt.savefig(output_path, dpi=300, bbox_inches='tight')
-            print(f"Monthly chart saved to {output_path}")
-        else:
-            plt.show()
-        
-        plt.close()
-    
-    def plot_timeline(self, output_path: str = None):
+
+        fig = _new_figure((12, 6), output_path)
+        ax = fig.subplots()
+        ax.bar(months, counts, color='#25D366', edgecolor='black', alpha=0.7)
+
+        ax.set_xlabel('Month', fontsize=12)
+        ax.set_ylabel('Number of Times Said', fontsize=12)
+        ax.set_title(f"Monthly Usage of '{self.analysis['phrase']}'", fontsize=14, fontweight='bold')
+        ax.tick_params(axis='x', labelrotation=45)
+        for label in ax.get_xticklabels():
+            label.set_horizontalalignment('right')
+        ax.grid(axis='y', alpha=0.3)
+
+        _save(fig, output_path, "Monthly chart", self.dpi, self.fmt, self.preview)
+        return True
+
+    def plot_timeline(self, output_path: str = None) -> bool:
         """Create a timeline showing exactly when the phrase was said."""
         occurrences = self.analysis['occurrences']
-        
+
         if not occurrences:
-            print("No data to plot.")
-            return
-        
-        dates = [occ['datetime'] for occ in occurrences]
-        
+            print("No data to plot.", file=sys.stderr)
+            return False
+
         # Count occurrences per day
-        daily_counts = Counter([d.date() for d in dates])
-        plot_dates = list(daily_counts.keys())
-        plot_counts = list(daily_counts.values())
-        
-        plt.figure(figsize=(14, 6))
-        plt.scatter(plot_dates, plot_counts, c='#25D366', s=50, alpha=0.6, edgecolors='black')
-        plt.plot(plot_dates, plot_counts, color='#128C7E', alpha=0.3, linewidth=1)
-        
-        plt.xlabel('Date', fontsize=12)
-        plt.ylabel('Times Said Per Day', fontsize=12)
-        plt.title(f"Timeline of '{self.analysis['phrase']}'", fontsize=14, fontweight='bold')
-        plt.gcf().autofmt_xdate()
-        plt.grid(alpha=0.3)
-        plt.tight_layout()
-        
-        if output_path:
-            plt.savefig(output_path, dpi=300, bbox_inches='tight')
-            print(f"Timeline chart saved to {output_path}")
+        plot_dates, plot_counts = occurrences.daily_counts()
+
+        figsize = (14, 6)
+        fig = _new_figure(figsize, output_path)
+        ax = fig.subplots()
+
+        # Beyond a few points per pixel column markers only overlap, so dense
+        # timelines are drawn as binned totals, whatever their number of days
+        max_bins = int(figsize[0] * self.dpi / TIMELINE_PIXELS_PER_BIN)
+        if len(plot_dates) <= max_bins:
+            ax.scatter(plot_dates, plot_counts, c='#25D366', s=50, alpha=0.6, edgecolors='black')
+            ax.plot(plot_dates, plot_counts, color='#128C7E', alpha=0.3, linewidth=1)
+            period = 'Day'
         else:
-            plt.show()
-        
-        plt.close()
-    
+            starts, totals, width = timeline_bins(plot_dates, plot_counts, max_bins)
+            # Repeat the last value so the last bin is drawn at full width
+            edges = np.append(starts, starts[-1] + np.timedelta64(width, 'D'))
+            heights = np.append(totals, totals[-1])
+            ax.fill_between(edges, heights, step='post', color='#25D366', alpha=0.4)
+            ax.step(edges, heights, where='post', color='#128C7E', linewidth=1)
+            period = BIN_NAMES.get(width, f"{width} Days")
+
+        ax.set_xlabel('Date', fontsize=12)
+        ax.set_ylabel(f'Times Said Per {period}', fontsize=12)
+        ax.set_title(f"Timeline of '{self.analysis['phrase']}'", fontsize=14, fontweight='bold')
+        fig.autofmt_xdate()
+        ax.grid(alpha=0.3)
+
+        _save(fig, output_path, "Timeline chart", self.dpi, self.fmt, self.preview)
+        return True
+
+    def plot_weekly_usage(self, output_path: str = None) -> bool:
+        """Create a chart of the phrase's use per week, including quiet weeks."""
+        weeks, counts = self.analysis['cube'].by_week()
+
+        if not len(weeks):
+            print("No data to plot.", file=sys.stderr)
+            return False
+
+        fig = _new_figure((14, 6), output_path)
+        ax = fig.subplots()
+        ax.fill_between(weeks, counts, step='post', color='#25D366', alpha=0.4)
+        ax.step(weeks, counts, where='post', color='#128C7E', linewidth=1)
+
+        ax.set_xlabel('Week', fontsize=12)
+        ax.set_ylabel('Times Said Per Week', fontsize=12)
+        ax.set_title(f"Weekly Usage of '{self.analysis['phrase']}'", fontsize=14, fontweight='bold')
+        fig.autofmt_xdate()
+        ax.grid(alpha=0.3)
+
+        _save(fig, output_path, "Weekly chart", self.dpi, self.fmt, self.preview)
+        return True
+
+    def plot_hourly_usage(self, output_path: str = None) -> bool:
+        """Create a bar chart of the phrase's use by hour of the day."""
+        cube = self.analysis['cube']
+
+        if not cube.total():
+            print("No data to plot.", file=sys.stderr)
+            return False
+
+        fig = _new_figure((12, 6), output_path)
+        ax = fig.subplots()
+        ax.bar(range(24), cube.by_hour(), color='#34B7F1', edgecolor='black', alpha=0.7)
+
+        ax.set_xlabel('Hour of Day', fontsize=12)
+        ax.set_ylabel('Number of Times Said', fontsize=12)
+        ax.set_title(f"Usage of '{self.analysis['phrase']}' by Hour", fontsize=14, fontweight='bold')
+        ax.set_xticks(range(24))
+        ax.set_xticklabels([f"{hour:02d}" for hour in range(24)])
+        ax.grid(axis='y', alpha=0.3)
+
+        _save(fig, output_path, "Hourly chart", self.dpi, self.fmt, self.preview)
+        return True
+
+    def plot_sender_usage(self, output_path: str = None, top: int = 20) -> bool:
+        """Create a horizontal bar chart of who said the phrase most."""
+        by_sender = self.analysis['cube'].by_sender()
+
+        if not by_sender:
+            print("No data to plot.", file=sys.stderr)
+            return False
+
+        senders = list(by_sender)[:top][::-1]
+        counts = [by_sender[sender] for sender in senders]
+
+        fig = _new_figure((12, max(4, 0.4 * len(senders) + 2)), output_path)
+        ax = fig.subplots()
+        ax.barh(senders, counts, color='#075E54', edgecolor='black', alpha=0.7)
+
+        ax.set_xlabel('Number of Times Said', fontsize=12)
+        ax.set_title(f"Who Says '{self.analysis['phrase']}'", fontsize=14, fontweight='bold')
+        ax.grid(axis='x', alpha=0.3)
+
+        _save(fig, output_path, "Sender chart", self.dpi, self.fmt, self.preview)
+        return True
+
     @staticmethod
-    def plot_master_graph(analyses: List[Dict], output_path: str = None):
+    def plot_master_graph(analyses: List[Dict], output_path: str = None, dpi: int = DEFAULT_DPI,
+                          fmt: str = 'png', preview: bool = False) -> bool:
         """Create a master graph combining all phrases' monthly counts."""
         if not analyses:
-            print("No data to plot.")
-            return
-        
+            print("No data to plot.", file=sys.stderr)
+            return False
+
         # Collect all unique months
         all_months = set()
         for analysis in analyses:
             all_months.update(analysis['monthly_counts'].keys())
-        
+
         all_months = sorted(list(all_months))
-        
+
         if not all_months:
-            print("No monthly data available.")
-            return
-        
+            print("No monthly data available.", file=sys.stderr)
+            return False
+
         # Prepare data for stacked bar chart
-        fig, ax = plt.subplots(figsize=(14, 7))
-        
+        fig = _new_figure((14, 7), output_path)
+        ax = fig.subplots()
+
         # Colors for different phrases
         colors = ['#25D366', '#128C7E', '#075E54', '#34B7F1', '#ECE5DD', '#FF6B6B', '#4ECDC4', '#FFE66D']
-        
+
         bottom = [0] * len(all_months)
-        
+
         for i, analysis in enumerate(analyses):
             phrase = analysis['phrase']
             counts = [analysis['monthly_counts'].get(month, 0) for month in all_months]
-            
+
             color = colors[i % len(colors)]
-            ax.bar(all_months, counts, bottom=bottom, label=phrase, 
+            ax.bar(all_months, counts, bottom=bottom, label=phrase,
                    color=color, edgecolor='black', alpha=0.8)
-            
+
             # Update bottom for stacking
             bottom = [b + c for b, c in zip(bottom, counts)]
-        
+
         ax.set_xlabel('Month', fontsize=12, fontweight='bold')
         ax.set_ylabel('Total Count', fontsize=12, fontweight='bold')
         ax.set_title('Master Graph - Combined Monthly Usage of All Phrases', fontsize=14, fontweight='bold')
         ax.legend(loc='upper left', framealpha=0.9)
-        plt.xticks(rotation=45, ha='right')
-        plt.grid(axis='y', alpha=0.3)
-        plt.tight_layout()
-        
-        if output_path:
-            plt.savefig(output_path, dpi=300, bbox_inches='tight')
-            print(f"Master graph saved to {output_path}")
+        ax.tick_params(axis='x', labelrotation=45)
+        for label in ax.get_xticklabels():
+            label.set_horizontalalignment('right')
+        ax.grid(axis='y', alpha=0.3)
+
+        _save(fig, output_path, "Master graph", PREVIEW_DPI if preview else dpi, fmt, preview)
+        return True
+
+
+def _new_figure(figsize: tuple, output_path: Optional[str]) -> Figure:
+    """Create a standalone figure, or a pyplot one if it is going to be shown."""
+    if output_path:
+        return Figure(figsize=figsize)
+
+    # Only interactive display needs the global pyplot state
+    import matplotlib.pyplot as plt
+    return plt.figure(figsize=figsize)
+
+
+def _save(fig: Figure, output_path: Optional[str], label: str, dpi: int, fmt: str, preview: bool):
+    """Write a figure to ``output_path``, or show it if no path is given."""
+    if not preview:
+        fig.tight_layout()
+
+    if not output_path:
+        import matplotlib.pyplot as plt
+        plt.show()
+        plt.close(fig)
+        return
+
+    if preview:
+        fig.savefig(output_path, dpi=dpi, format=fmt)
+    else:
+        fig.savefig(output_path, dpi=dpi, format=fmt, bbox_inches='tight')
+    print(f"{label} saved to {output_path}", file=sys.stderr)
+
+
+def _render_phrase(analysis: Dict, output_dir: str, dpi: int, fmt: str, preview: bool,
+                   views: Tuple[str, ...] = DEFAULT_VIEWS) -> Dict:
+    """Render the charts of one phrase (runs in a worker process)."""
+    safe_phrase = chart_filename(analysis['phrase'])
+
+    charts = {'phrase': analysis['phrase']}
+    for view in views:
+        path = os.path.join(output_dir, f"{safe_phrase}_{view}.{fmt}")
+        # Views without data are not written
+        if render_view(analysis, view, path, dpi, fmt, preview):
+            charts[view] = path
+    return charts
+
+
+def render_view(analysis: Dict, view: str, output_path: str, dpi: int = DEFAULT_DPI,
+                fmt: str = 'png', preview: bool = False) -> bool:
+    """Render one chart (one of VIEWS) of a phrase to ``output_path``.
+
+    Returns False, without writing anything, if there was no data to plot.
+    """
+    visualizer = ChatVisualizer(analysis, dpi, fmt, preview)
+    plots = {
+        'monthly': visualizer.plot_monthly_usage,
+        'timeline': visualizer.plot_timeline,
+        'weekly': visualizer.plot_weekly_usage,
+        'hourly': visualizer.plot_hourly_usage,
+        'senders': visualizer.plot_sender_usage,
+    }
+    return plots[view](output_path)
+
+
+def _render_master(analyses: List[Dict], output_dir: str, dpi: int, fmt: str, preview: bool) -> Optional[str]:
+    """Render the master graph; returns None if there was nothing to plot."""
+    master_chart = os.path.join(output_dir, f"master_combined_graph.{fmt}")
+    saved = ChatVisualizer.plot_master_graph(analyses, master_chart, dpi, fmt, preview)
+    return master_chart if saved else None
+
+
+def render_charts(analyses: List[Dict], output_dir: str = 'output', dpi: int = DEFAULT_DPI,
+                  fmt: str = 'png', preview: bool = False, workers: Optional[int] = None,
+                  views: Tuple[str, ...] = DEFAULT_VIEWS) -> Dict:
+    """Render the charts of every phrase, and the master graph, concurrently.
+
+    Each phrase's charts (and the master graph when there are several
+    phrases) are rendered in a process pool; ``views`` picks the charts
+    from VIEWS. Returns the chart paths per phrase, keyed by view, the
+    master graph path (or None, with the error message in 'master_error'
+    if it failed) and the total render time in seconds.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported chart format: {fmt}")
+    unknown = set(views) - set(VIEWS)
+    if unknown:
+        raise ValueError(f"Unsupported chart view: {', '.join(sorted(unknown))}")
+
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    options = (output_dir, dpi, fmt, preview)
+    views = tuple(views)
+
+    jobs = len(analyses) + (1 if len(analyses) > 1 else 0)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, jobs)
+
+    with span('render charts', phrases=len(analyses), workers=workers, dpi=dpi):
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                master = executor.submit(_render_master, analyses, *options) if len(analyses) > 1 else None
+                charts = [executor.submit(_render_phrase, analysis, *options, views) for analysis in analyses]
+                charts = [future.result() for future in charts]
         else:
-            plt.show()
-        
-        plt.close()
\ No newline at end of file
+            charts = [_render_phrase(analysis, *options, views) for analysis in analyses]
+            master = None
+
+        # A failed master graph should not throw away the per-phrase charts
+        master_chart, master_error = None, None
+        if len(analyses) > 1:
+            try:
+                master_chart = master.result() if master else _render_master(analyses, *options)
+            except Exception as e:
+                print(f"Error creating master graph: {e}", file=sys.stderr)
+                master_error = str(e)
+
+    return {
+        'charts': charts,
+        'master': master_chart,
+        'master_error': master_error,
+        'seconds': time.perf_counter() - start,
+    }
@@ -0,0 +1,15 @@
+import pytest
+
+from benchmarks.synth import generate_chat
+
+
+@pytest.fixture(scope='session')
+def chat_files(tmp_path_factory):
+    """Synthetic exports, one per supported format, keyed by format number."""
+    directory = tmp_path_factory.mktemp('chats')
+    paths = {}
+    for fmt in range(4):
+        path = directory / f'chat_{fmt}.txt'
+        generate_chat(str(path), 3000, fmt=fmt, seed=fmt, multiline_rate=0.1, system_rate=0.02)
+        paths[fmt] = str(path)
+    return paths
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+import src.index
+from benchmarks.synth import generate_chat
+from src.analyzer import ChatAnalyzer, PhraseCounter
+from src.ingest import load_analyzer
+from src.parser import WhatsAppParser
+
+
+PHRASES = ['hello', 'LOL', 'lol', 'café', 'Straße', '😂', 'see you', 'o', 'no such phrase']
+
+
+def assert_same_analysis(actual, expected):
+    assert len(actual) == len(expected)
+    for got, want in zip(actual, expected):
+        assert got['phrase'] == want['phrase']
+        assert got['total_count'] == want['total_count']
+        assert got['monthly_counts'] == want['monthly_counts']
+        assert got['occurrences'] == want['occurrences']
+        assert np.array_equal(got['cube'].by_hour(), want['cube'].by_hour())
+        assert got['cube'].by_sender() == want['cube'].by_sender()
+
+
+def test_empty_phrase_is_rejected(chat_files):
+    analyzer = ChatAnalyzer(WhatsAppParser(chat_files[0]).parse_store())
+    with pytest.raises(ValueError):
+        analyzer.count_phrase('')
+    with pytest.raises(ValueError):
+        analyzer.count_phrases(['hello', ''])
+    with pytest.raises(ValueError):
+        PhraseCounter([''])
+
+
+def test_cached_results_match_fresh_counts(chat_files):
+    store = WhatsAppParser(chat_files[1]).parse_store()
+    analyzer = ChatAnalyzer(store, cache_size=2)
+    first = analyzer.count_phrases(['hello', 'lol', 'café'])
+    again = analyzer.count_phrases(['hello', 'lol', 'café'])
+
+    for actual, expected in zip(again, first):
+        assert actual['total_count'] == expected['total_count']
+        assert actual['monthly_counts'] == expected['monthly_counts']
+        assert actual['occurrences'] == expected['occurrences']
+    assert analyzer.cache_info()['size'] == 2
+
+
+def test_cache_misses_after_the_messages_change(chat_files):
+    analyzer = ChatAnalyzer(WhatsAppParser(chat_files[0]).parse_store())
+    analyzer.count_phrase('hello')
+    analyzer.count_phrase('hello')
+    assert analyzer.cache_info()['hits'] == 1
+
+    analyzer.version += 1
+    analyzer.count_phrase('hello')
+    assert analyzer.cache_info()['misses'] == 2
+
+
+@pytest.mark.parametrize('case_sensitive', [False, True])
+def test_extend_matches_fresh_count(chat_files, case_sensitive):
+    store = WhatsAppParser(chat_files[2]).parse_store()
+    analyzer = ChatAnalyzer(store.slice(0, 2000))
+    analyzer.count_phrases(PHRASES, case_sensitive)
+
+    # Replacing the last message too, as a tail parse does
+    analyzer.extend(store.slice(1999, len(store)), replace_last=True)
+    info = analyzer.cache_info()
+    actual = analyzer.count_phrases(PHRASES, case_sensitive)
+
+    assert analyzer.cache_info()['hits'] == info['hits'] + len(PHRASES)
+    assert_same_analysis(actual, ChatAnalyzer(store).count_phrases(PHRASES, case_sensitive))
+
+
+def test_reload_of_a_grown_export_extends_the_analyzer(tmp_path):
+    path = str(tmp_path / 'chat.txt')
+    cache_dir = str(tmp_path / 'cache')
+    generate_chat(path, 1000, seed=3)
+    analyzer, _ = load_analyzer([path], cache_dir=cache_dir)
+    analyzer.count_phrases(PHRASES)
+
+    generate_chat(path, 1500, seed=3)
+    reloaded, _ = load_analyzer([path], analyzer, cache_dir=cache_dir)
+    fresh, _ = load_analyzer([path], cache_dir=None)
+
+    assert reloaded is analyzer
+    assert list(reloaded.messages) == list(fresh.messages)
+    assert_same_analysis(reloaded.count_phrases(PHRASES), fresh.count_phrases(PHRASES))
+
+
+@pytest.mark.parametrize('case_sensitive', [False, True])
+def test_index_matches_scan(chat_files, monkeypatch, case_sensitive):
+    store = WhatsAppParser(chat_files[0]).parse_store()
+    scanned = ChatAnalyzer(store).count_phrases(PHRASES, case_sensitive)
+
+    # Small enough that the index is built in several blocks
+    monkeypatch.setattr(src.index, 'BUILD_BLOCK_BYTES', 16 * 1024)
+    indexed = ChatAnalyzer(store)
+    indexed.build_index(case_sensitive)
+    assert_same_analysis(indexed.count_phrases(PHRASES, case_sensitive), scanned)
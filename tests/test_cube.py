@@ -0,0 +1,31 @@
+from collections import Counter
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from src.analyzer import ChatAnalyzer
+from src.parser import WhatsAppParser
+
+
+@pytest.mark.parametrize('phrase', ['lol', 'o', 'no such phrase'])
+def test_rollups_match_a_direct_count(chat_files, phrase):
+    store = WhatsAppParser(chat_files[3]).parse_store()
+    cube = ChatAnalyzer(store).count_phrase(phrase)['cube']
+
+    weekly, monthly, hourly = Counter(), Counter(), Counter()
+    for msg in store:
+        count = msg['message'].casefold().count(phrase)
+        if count:
+            day = msg['datetime'].date()
+            weekly[day - timedelta(days=day.weekday())] += count
+            monthly[f"{day:%Y-%m}"] += count
+            hourly[msg['datetime'].hour] += count
+
+    weeks, counts = cube.by_week()
+    # Every week from the first to the last hit, quiet ones included
+    if weekly:
+        assert len(weeks) == (max(weekly) - min(weekly)).days // 7 + 1
+    assert {week.item(): int(count) for week, count in zip(weeks, counts) if count} == weekly
+    assert cube.by_month() == dict(sorted(monthly.items()))
+    assert np.array_equal(cube.by_hour(), [hourly[hour] for hour in range(24)])
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from src.analyzer import ChatAnalyzer, PhraseCounter
+from src.ingest import load_files, stream_files
+
+
+PHRASES = ['hello', 'lol', 'café', '😂', 'see you']
+
+
+@pytest.fixture
+def overlapping_files(chat_files):
+    # The first file twice, so every one of its messages is a duplicate
+    return [chat_files[0], chat_files[2], chat_files[0]]
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_load_files_drops_duplicates(overlapping_files, workers):
+    store, duplicates = load_files(overlapping_files, cache_dir=None, workers=workers)
+    single, _ = load_files(overlapping_files[:1], cache_dir=None)
+    other, _ = load_files(overlapping_files[1:2], cache_dir=None)
+
+    assert duplicates == len(single)
+    assert len(store) == len(single) + len(other)
+    assert np.all(np.diff(store.timestamps) >= 0)
+
+
+@pytest.mark.parametrize('case_sensitive', [False, True])
+def test_stream_matches_in_memory(overlapping_files, case_sensitive):
+    store, duplicates = load_files(overlapping_files, cache_dir=None, workers=1)
+    expected = ChatAnalyzer(store).count_phrases(PHRASES, case_sensitive)
+
+    stream = stream_files(overlapping_files)
+    counter = PhraseCounter(PHRASES, case_sensitive)
+    for msg in stream:
+        counter.add(msg)
+
+    assert stream.messages == len(store)
+    assert stream.duplicates == duplicates
+    for actual, wanted in zip(counter.results(), expected):
+        assert actual['total_count'] == wanted['total_count']
+        assert actual['monthly_counts'] == wanted['monthly_counts']
+        for got, want in zip(actual['occurrences'].daily_counts(), wanted['occurrences'].daily_counts()):
+            assert np.array_equal(got, want)
+        assert np.array_equal(actual['cube'].by_hour(), wanted['cube'].by_hour())
+        assert actual['cube'].by_sender() == wanted['cube'].by_sender()
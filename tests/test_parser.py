@@ -0,0 +1,63 @@
+import os
+import zipfile
+
+import pytest
+
+import src.parser
+from benchmarks.synth import generate_chat
+from src.parser import WhatsAppParser, chat_size
+
+
+@pytest.mark.parametrize('fmt', range(4))
+def test_chunked_parse_matches_serial(chat_files, monkeypatch, fmt):
+    path = chat_files[fmt]
+    serial = WhatsAppParser(path)
+    expected = list(serial.parse_store(workers=1))
+
+    # Small enough that the test files are split into several chunks
+    monkeypatch.setattr(src.parser, 'MIN_CHUNK_BYTES', 16 * 1024)
+    chunked = WhatsAppParser(path)
+    assert len(chunked.split_ranges(4)) == 4
+    assert list(chunked.parse_store(workers=4)) == expected
+    assert chunked.checkpoint == serial.checkpoint
+
+
+@pytest.mark.parametrize('fmt', range(4))
+def test_tail_parse_matches_full_parse(tmp_path, fmt):
+    path = str(tmp_path / 'chat.txt')
+    generate_chat(path, 1000, fmt=fmt, seed=fmt)
+    parser = WhatsAppParser(path)
+    first = parser.parse()
+
+    # The same seed writes the same messages first, as a longer re-export would
+    generate_chat(path, 1500, fmt=fmt, seed=fmt)
+    tail = WhatsAppParser(path).parse_tail(parser.checkpoint)
+
+    assert tail is not None
+    assert first[:-1] + tail == WhatsAppParser(path).parse()
+
+
+def test_tail_parse_rejects_changed_file(tmp_path):
+    path = str(tmp_path / 'chat.txt')
+    generate_chat(path, 1000, seed=1)
+    parser = WhatsAppParser(path)
+    parser.parse()
+
+    generate_chat(path, 1500, seed=2)
+    assert WhatsAppParser(path).parse_tail(parser.checkpoint) is None
+
+
+@pytest.mark.parametrize('member', ['_chat.txt', 'WhatsApp Chat with Family.txt'])
+@pytest.mark.parametrize('fmt', range(4))
+def test_zip_parse_matches_text(chat_files, tmp_path, fmt, member):
+    path = chat_files[fmt]
+    archive = str(tmp_path / 'chat.zip')
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as export:
+        export.write(path, member)
+        # Exports with media also hold the attachments
+        export.writestr('IMG-20200101-WA0001.jpg', b'\xff\xd8\xff\xe0')
+
+    expected = WhatsAppParser(path).parse()
+    assert WhatsAppParser(archive).parse() == expected
+    assert list(WhatsAppParser(archive).parse_store(workers=4)) == expected
+    assert chat_size(archive) == os.path.getsize(path)
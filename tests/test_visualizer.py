@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from src.visualizer import timeline_bins
+
+
+def daily_counts(span_days, every=1):
+    days = (np.datetime64('2019-12-30') + np.arange(0, span_days, every)).astype('datetime64[D]')
+    return days, np.arange(1, len(days) + 1, dtype=np.int64)
+
+
+@pytest.mark.parametrize('span_days, max_bins, width', [
+    (100, 100, 1),
+    (101, 100, 2),
+    (700, 100, 7),
+    (3000, 100, 91),
+    (10000, 10, 1000),
+])
+def test_timeline_bins_picks_the_smallest_width_that_fits(span_days, max_bins, width):
+    days, counts = daily_counts(span_days)
+    starts, totals, actual = timeline_bins(days, counts, max_bins)
+
+    assert actual == width
+    assert len(totals) <= max_bins
+    assert totals.sum() == counts.sum()
+    assert starts[0] == days[0]
+    assert np.all(np.diff(starts) == np.timedelta64(width, 'D'))
+
+
+def test_timeline_bins_keeps_empty_bins():
+    # A hit every 30 days, in bins of a week
+    days, counts = daily_counts(3 * 365, every=30)
+    starts, totals, width = timeline_bins(days, counts, 200)
+
+    assert width == 7
+    assert len(starts) == len(totals) == (days[-1] - days[0]).astype(int) // 7 + 1
+    assert np.count_nonzero(totals) == len(days)
+    # Each day's count lands in the bin that starts at most a week before it
+    bins = (days - starts[0]).astype(int) // 7
+    assert np.array_equal(totals[bins], counts)
+
+
+def test_timeline_bins_of_a_single_day():
+    days = np.array(['2021-06-01'], dtype='datetime64[D]')
+    starts, totals, width = timeline_bins(days, np.array([5]), 10)
+    assert width == 1
+    assert list(starts) == list(days)
+    assert list(totals) == [5]